@@ -0,0 +1,190 @@
+'''
+Surrogate-assisted adaptive sampling of scenarios for open exploration
+
+Instead of evaluating a fixed sample of scenarios, the exploration starts with
+a small Latin hypercube sample and fits a Gaussian process surrogate of every
+outcome for every policy on the uncertainties of the completed scenarios.
+Every next batch of scenarios is picked from a large pool of candidates where
+the surrogates are most uncertain ('uncertainty') or where they are most
+likely to disagree on the ranking of the policies ('ranking'). The
+exploration stops when the expected outcomes of the policies over the
+uncertainty space (estimated with the surrogates) no longer change, or when
+the maximum number of scenarios is reached.
+
+The surrogates are Gaussian processes of scikit-learn (a dependency of the EMA
+workbench) with a squared exponential kernel and a noise term on the
+uncertainties scaled to [0, 1], fitted per outcome and policy by the marginal
+likelihood.
+
+'''
+
+# import required packages
+import math, warnings
+import numpy as np
+import pandas as pd
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, RBF, WhiteKernel
+from ema_workbench import Scenario
+from ema_workbench.util import get_module_logger
+
+_logger = get_module_logger(__name__)
+
+# define a function for fitting a Gaussian process to every target (column of Y) on the scaled inputs X, each with its own hyperparameters
+def fit_surrogates(X, Y):
+    kernel = ConstantKernel(1.0, (1e-3, 1e3)) * RBF(0.3, (0.05, 5.0)) + WhiteKernel(1e-4, (1e-8, 1e-1))
+    with warnings.catch_warnings():
+
+        # hyperparameters at the bounds of the kernel (e.g. no noise) are expected for smooth outcomes
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        return [GaussianProcessRegressor(kernel, normalize_y = True).fit(X, y) for y in np.asarray(Y, dtype = float).T]
+
+# define a function for the predicted mean and standard deviation of the surrogates (both n x m, in the units of the targets)
+def predict(surrogates, X):
+    predictions = [surrogate.predict(X, return_std = True) for surrogate in surrogates]
+    return np.column_stack([mean for mean, _ in predictions]), np.column_stack([std for _, std in predictions])
+
+# vectorized complementary error function
+_erfc = np.vectorize(math.erfc, otypes = [float])
+
+# define a function for a Latin hypercube sample in the unit cube
+def latin_hypercube(n, d, rng):
+    return (np.argsort(rng.random((n, d)), 0) + rng.random((n, d))) / n
+
+# define a class for the adaptive exploration of the uncertainty space
+class AdaptiveExploration:
+
+    # create an instance of this class
+    #   evaluator: an (initialized) evaluator of the models, policies: the policies to evaluate in every scenario
+    #   outcomes: names of the scalar outcomes to fit (all scalar outcomes of the first model except the failed run flag by default)
+    #   criterion: 'ranking' (disagreement on the order of the policies) or 'uncertainty' (surrogate standard deviation)
+    #   aggregate: how the outcomes of the models (e.g. weeks and perspectives) are combined per scenario and policy
+    def __init__(self, evaluator, policies, uncertainties = None, outcomes = None, n_initial = 20, batch_size = 10,
+                 max_scenarios = 100, n_candidates = 2000, criterion = 'ranking', tolerance = 0.01, patience = 2,
+                 aggregate = 'mean', seed = None):
+
+        model = evaluator._msis[0]
+        self.evaluator = evaluator
+        self.policies = policies
+        self.uncertainties = list(uncertainties if uncertainties is not None else model.uncertainties)
+        self.outcomes = list(outcomes if outcomes is not None else
+                             [outcome.name for outcome in model.outcomes
+                              if outcome.__class__.__name__ == 'ScalarOutcome' and 'Failed' not in outcome.variable_name])
+        self.n_initial = n_initial
+        self.batch_size = batch_size
+        self.max_scenarios = max_scenarios
+        self.n_candidates = n_candidates
+        self.criterion = criterion
+        self.tolerance = tolerance
+        self.patience = patience
+        self.aggregate = aggregate
+        self.rng = np.random.default_rng(seed)
+
+        if criterion not in ('ranking', 'uncertainty'):
+            raise ValueError(f'unknown criterion {criterion}, use ranking or uncertainty')
+
+        # define the bounds of the uncertainties
+        self.lower = np.array([u.lower_bound for u in self.uncertainties], dtype = float)
+        self.upper = np.array([u.upper_bound for u in self.uncertainties], dtype = float)
+
+        # keep the number of evaluated scenarios and the estimates of every iteration
+        self.n_scenarios = 0
+        self.history = []
+
+    # define a function for evaluating scenarios given as points in the unit cube
+    def _evaluate(self, points):
+        values = self.lower + points * (self.upper - self.lower)
+        scenarios = [Scenario(f'adaptive {self.n_scenarios + i}', **{u.name: float(v) for u, v in zip(self.uncertainties, row)})
+                     for i, row in enumerate(values)]
+        self._results.append(self.evaluator.perform_experiments(scenarios = scenarios, policies = self.policies))
+        self.n_scenarios += len(scenarios)
+
+    # define a function for combining the results of all batches
+    def _combined_results(self):
+        experiments = pd.concat([experiments for experiments, _ in self._results], ignore_index = True)
+        outcomes = {name: np.concatenate([outcomes[name] for _, outcomes in self._results]) for name in self._results[0][1]}
+        return experiments, outcomes
+
+    # define a function for the surrogate training data: scaled uncertainties (scenarios x d) and targets (scenarios x outcomes*policies)
+    def _training_data(self):
+        experiments, outcomes = self._combined_results()
+        data = experiments[['scenario', 'policy']].astype(str).assign(**{name: outcomes[name] for name in self.outcomes})
+        targets = data.groupby(['scenario', 'policy']).agg(self.aggregate).unstack('policy')
+        targets = targets.reindex(columns = pd.MultiIndex.from_product([self.outcomes, self.policy_names])).dropna()
+        X = experiments.astype({'scenario': str}).groupby('scenario')[[u.name for u in self.uncertainties]].first()
+        X = X.loc[targets.index].to_numpy(dtype = float)
+        return (X - self.lower) / (self.upper - self.lower), targets.to_numpy(dtype = float)
+
+    # define a function for the score of candidate scenarios
+    def _score(self, mean, std):
+        n_policies = len(self.policy_names)
+        mean = mean.reshape(len(mean), len(self.outcomes), n_policies)
+        std = std.reshape(len(std), len(self.outcomes), n_policies)
+
+        # scale every outcome by its spread, so the outcomes weigh equally
+        scale = self._outcome_scale[None, :, None]
+        if self.criterion == 'uncertainty':
+            return np.mean(std / scale, (1, 2))
+
+        # the expected number of policy pairs in the wrong order (for every outcome)
+        i, j = np.triu_indices(n_policies, 1)
+        z = np.abs(mean[:, :, i] - mean[:, :, j]) / np.maximum(np.sqrt(std[:, :, i]**2 + std[:, :, j]**2), 1e-12 * scale)
+        return np.mean(0.5 * _erfc(z / math.sqrt(2)), (1, 2))
+
+    # define a function for picking a batch of candidates with high scores that are not too close to each other
+    def _select(self, candidates, score, length_scale):
+        selected = []
+        score = score.copy()
+        for _ in range(min(self.batch_size, len(candidates))):
+            best = int(np.argmax(score))
+            selected.append(best)
+
+            # reduce the score close to the selected candidate, as its result also informs the neighbourhood
+            distances = np.sum((candidates - candidates[best])**2, 1)
+            score *= 1 - np.exp(-0.5 * distances / length_scale**2)
+            score[best] = -np.inf
+        return candidates[selected]
+
+    # define a function for running the exploration, returns the combined (experiments, outcomes) of all batches
+    def run(self):
+        self.policy_names = [policy.name for policy in self.policies]
+        self._results = []
+        self.n_scenarios = 0
+        stable = 0
+        previous = None
+
+        # evaluate the initial sample
+        self._evaluate(latin_hypercube(self.n_initial, len(self.uncertainties), self.rng))
+
+        while True:
+
+            # fit the surrogates to the completed scenarios
+            X, Y = self._training_data()
+            surrogates = fit_surrogates(X, Y)
+            scale = Y.std(0)
+            scale[scale == 0] = 1
+            self._outcome_scale = scale.reshape(len(self.outcomes), -1).max(1)
+
+            # estimate the expected outcome of every policy over the uncertainty space with a fresh candidate pool
+            candidates = latin_hypercube(self.n_candidates, len(self.uncertainties), self.rng)
+            mean, std = predict(surrogates, candidates)
+            estimates = mean.mean(0).reshape(len(self.outcomes), -1)
+
+            # check the convergence (change relative to the spread of the outcome)
+            change = np.inf if previous is None else float(np.max(np.abs(estimates - previous) / self._outcome_scale[:, None]))
+            stable = stable + 1 if change < self.tolerance else 0
+            previous = estimates
+            self.history.append({'scenarios': self.n_scenarios,
+                                 'change': change,
+                                 'estimates': pd.DataFrame(estimates, index = self.outcomes, columns = self.policy_names)})
+            _logger.info(f'adaptive exploration: {self.n_scenarios} scenarios, relative change of the estimates {change:.4f}')
+
+            if stable >= self.patience or self.n_scenarios >= self.max_scenarios:
+                break
+
+            # evaluate the next batch where the surrogates are least certain about the outcomes or the ranking of the policies
+            length_scale = np.median([surrogate.kernel_.k1.k2.length_scale for surrogate in surrogates])
+            batch = self._select(candidates, self._score(mean, std), length_scale)[:self.max_scenarios - self.n_scenarios]
+            self._evaluate(batch)
+
+        return self._combined_results()
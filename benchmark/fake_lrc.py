@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Stand-in for the Linny-R console (lrc.exe) for benchmarks on systems without Linny-R
+
+Honors the same command line as lrc (model name without '.lnr' and the
+experiment file, run from the model folder): it reads the experiment file,
+waits for a configurable time and writes <model>_exp.csv, <model>_exp.lp and
+<model>_exp.log like a real run. It only uses the standard library, so it
+starts as fast as a Python process can.
+
+Configured with environment variables:
+    FAKE_LRC_DELAY      solve time in seconds (default 0.1)
+    FAKE_LRC_ROWS       number of time steps in the output (default 672, one week of quarters)
+    FAKE_LRC_COLUMNS    ';' separated output variables (default the Botlek outcome variables)
+    FAKE_LRC_LP_SIZE    size of the .lp file in bytes (default 100000)
+    FAKE_LRC_EXIT_CODE  exit code to return after writing the output (default 0)
+
+'''
+
+# import required packages
+import os, sys, time, zlib
+
+# define the default output variables (the variables used by the Botlek outcomes)
+DEFAULT_COLUMNS = 'CF total;CF Air Liquide;CF Huntsman;CF Nouryon;CO2 emission;Use SP-A;Use SP-B;Chlorine storage'
+
+def main(argv):
+
+    # check the command line
+    if len(argv) != 3:
+        sys.stderr.write('usage: fake_lrc.py <model> <experiment file>\n')
+        return 2
+    model, experiment_file = argv[1], argv[2]
+
+    # read the configuration
+    delay = float(os.environ.get('FAKE_LRC_DELAY', 0.1))
+    rows = int(os.environ.get('FAKE_LRC_ROWS', 672))
+    columns = os.environ.get('FAKE_LRC_COLUMNS', DEFAULT_COLUMNS).split(';')
+    lp_size = int(os.environ.get('FAKE_LRC_LP_SIZE', 100000))
+    exit_code = int(os.environ.get('FAKE_LRC_EXIT_CODE', 0))
+
+    with open(f'{model}_exp.log', 'w') as log:
+
+        # check the model and experiment files like Linny-R would
+        if not os.path.isfile(f'{model}.lnr'):
+            log.write(f'ERROR: model file {model}.lnr not found\n')
+            return 1
+        try:
+            with open(experiment_file, 'rb') as fh:
+                data = fh.read()
+        except OSError:
+            log.write(f'ERROR: experiment file {experiment_file} not found\n')
+            return 1
+        n_lines = data.count(b'\n')
+        log.write(f'Read experiment file {experiment_file} ({len(data)} bytes, {n_lines} lines)\n')
+
+        # write the generated LP
+        with open(f'{model}_exp.lp', 'w') as fh:
+            fh.write('\\ generated by fake_lrc\n')
+            fh.write('x' * max(0, lp_size - 24) + '\n')
+
+        # "solve" the model
+        time.sleep(delay)
+
+        # write deterministic output that depends on the input
+        seed = zlib.crc32(data)
+        lines = ['T;' + ';'.join(columns)]
+        for t in range(1, rows + 1):
+            lines.append(';'.join([str(t)] + [str(((seed + t * (k + 1)) % 10000) / 10) for k in range(len(columns))]))
+        with open(f'{model}_exp.csv', 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+
+        log.write(f'Solved {model} in {delay} seconds\n')
+
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
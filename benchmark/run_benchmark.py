@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+Throughput benchmark for the Linny-R connector with a stand-in solver
+
+Runs BaseLinnyRModel (LinnyRModel) or LinnyRModel_Botlek end-to-end against
+fake_lrc.py in a temporary workspace, for every combination of evaluator type
+and number of workers. Every combination runs in a fresh Python process, so
+the memory figures are not polluted by earlier runs. Reports runs/second,
+latency percentiles of every phase (from the connector's JSONL trace), peak
+memory of the Python process and (on Linux) of the largest worker, all workers
+together and the largest solver process, and can compare the throughput
+against a saved baseline to catch regressions on CI:
+
+    python benchmark/run_benchmark.py --model botlek --evaluators threads,processes --workers 1,4,8 --output bench.json
+    python benchmark/run_benchmark.py --model botlek --baseline bench.json --tolerance 0.2
+
+Only the Botlek model needs the project's functions module (characteristic weeks).
+The reference data is taken from ./data if present, otherwise synthetic data
+is generated.
+
+'''
+
+# import required packages
+import argparse, json, os, resource, shutil, subprocess, sys, tempfile, time
+import numpy as np
+import pandas as pd
+
+# define the folders of the benchmark and the repository
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(BENCHMARK_DIRECTORY)
+
+# define the uncertainties of the Botlek model (variable name, lower bound, upper bound) as in open_exploration.py
+BOTLEK_UNCERTAINTIES = [('E day-ahead:Price', 0.7, 1.3),
+                        ('natural gas market:Price', 0.16, 0.32),
+                        ('CO2 EUROPEAN EMISSION ALLOWANCES:Price', 21.0, 150.0),
+                        ('H2 markt:Price', 0.12, 0.30),
+                        ('NaOH 50%:Price', 0.1, 0.3),
+                        ('Unbal opregelen:Price', 0.7, 1.3),
+                        ('Unbal afregelen:Price', 0.7, 1.3),
+                        ('Unbal afregelen:LB', 0.7, 1.3),
+                        ('Unbal opregelen:UB', 0.7, 1.3),
+                        ('Capex E-boiler:Price', 1.4*10**6, 2.0*10**6),
+                        ('OPEX E-BOILER:Price', 2.8*10**3, 4.0*10**3),
+                        ('CAPEX Steam Pipe:Price', 6.0*10**6, 12.0*10**6)]
+
+# define the output variables of the stand-in solver that are used as outcomes
+OUTCOME_VARIABLES = ['CF total', 'CF Air Liquide', 'CF Huntsman', 'CF Nouryon', 'CO2 emission', 'Use SP-A', 'Use SP-B']
+
+# define the phases reported by the connector
+PHASES = ['series', 'write', 'cache', 'solve', 'parse', 'cleanup']
+
+# define a function for setting up a workspace with models, reference data and the stand-in solver
+def create_workspace(n_models):
+    workspace = tempfile.mkdtemp(prefix = 'linnyr_benchmark_')
+
+    # create empty model files (the stand-in solver only checks that they exist)
+    os.makedirs(os.path.join(workspace, 'models'))
+    for week in range(1, n_models + 1):
+        open(os.path.join(workspace, 'models', f'benchmark_week_{week}.lnr'), 'w').close()
+
+    # use the real reference data if available, otherwise generate it
+    data_directory = os.path.join(REPOSITORY_DIRECTORY, 'data')
+    if os.path.isdir(data_directory):
+        shutil.copytree(data_directory, os.path.join(workspace, 'data'))
+    else:
+        os.makedirs(os.path.join(workspace, 'data'))
+        rng = np.random.default_rng(0)
+        pd.DataFrame({'invoeden_EURMWh': rng.normal(50, 30, 35040),
+                      'afnemen_EURMWh': rng.normal(40, 30, 35040),
+                      'imbalance_demand': rng.uniform(0, 300, 35040),
+                      'imbalance_supply': rng.uniform(0, 300, 35040)}).to_csv(os.path.join(workspace, 'data', 'imbalance_market_electricity_data.csv'), index = False)
+        pd.DataFrame({'Data_2019': rng.normal(40, 10, 8760),
+                      'Data_2030': rng.normal(55, 15, 8760)}).to_csv(os.path.join(workspace, 'data', 'day_ahead_market_electricity_data.csv'), index = False)
+
+    # make the stand-in solver executable
+    solver = os.path.join(BENCHMARK_DIRECTORY, 'fake_lrc.py')
+    os.chmod(solver, os.stat(solver).st_mode | 0o111)
+
+    return workspace, solver
+
+# define a function for creating the models of a benchmark
+def create_models(model_type, n_models, solver, trace_file):
+    from ema_workbench import RealParameter, BooleanParameter, ScalarOutcome, ArrayOutcome
+    from linnyr_connector import LinnyRModel
+
+    models = []
+    for week in range(1, n_models + 1):
+        if model_type == 'botlek':
+            from linnyr_connector import LinnyRModel_Botlek
+            model = LinnyRModel_Botlek(name = f'benchmarkweek{week}', wd = './models', model_file = f'benchmark_week_{week}.lnr')
+            model.uncertainties = [RealParameter(name = variable, variable_name = variable, lower_bound = lower, upper_bound = upper)
+                                   for variable, lower, upper in BOTLEK_UNCERTAINTIES]
+            model.levers = [BooleanParameter(name = 'E-boiler', variable_name = 'e_boiler'),
+                            BooleanParameter(name = 'Steam Pipe', variable_name = 'steam_pipe'),
+                            BooleanParameter(name = 'Chlorine Storage', variable_name = 'chlorine_storage')]
+        else:
+            model = LinnyRModel(name = f'benchmarkweek{week}', wd = './models', model_file = f'benchmark_week_{week}.lnr')
+            model.uncertainties = [RealParameter(name = variable, variable_name = variable, lower_bound = lower, upper_bound = upper)
+                                   for variable, lower, upper in BOTLEK_UNCERTAINTIES]
+
+        model.outcomes = ([ScalarOutcome(name = variable, variable_name = variable, function = np.sum) for variable in OUTCOME_VARIABLES]
+                          + [ArrayOutcome(name = 'Chlorine storage', variable_name = 'Chlorine storage'),
+                             ArrayOutcome(name = 'Run-time', variable_name = 'Run-time')])
+
+        # use the stand-in solver and trace every run
+        model.linnyr = solver
+        model.trace_file = trace_file
+        models.append(model)
+
+    return models
+
+# define a function for running a single benchmark configuration (in a fresh process)
+def run_one(config):
+    sys.path.insert(0, REPOSITORY_DIRECTORY)
+    from ema_workbench import Policy, SequentialEvaluator, MultiprocessingEvaluator
+    from thread_evaluator import ThreadPoolEvaluator
+
+    # configure the stand-in solver
+    os.environ['FAKE_LRC_DELAY'] = str(config['delay'])
+    os.environ['FAKE_LRC_ROWS'] = str(config['rows'])
+
+    workspace, solver = create_workspace(config['n_models'])
+    trace_file = os.path.join(workspace, 'trace.jsonl')
+    curdir = os.getcwd()
+    os.chdir(workspace)
+    try:
+        models = create_models(config['model'], config['n_models'], solver, trace_file)
+
+        # define the policies (only used by the Botlek model)
+        if config['model'] == 'botlek':
+            policies = [Policy('None of the options', **{'Steam Pipe':False, 'E-boiler':False, 'Chlorine Storage':False}),
+                        Policy('All options', **{'Steam Pipe':True, 'E-boiler':True, 'Chlorine Storage':True})]
+        else:
+            policies = 0
+        n_policies = len(policies) if policies else 1
+        scenarios = max(1, config['experiments'] // (n_policies * config['n_models']))
+
+        # create the evaluator
+        if config['evaluator'] == 'threads':
+            evaluator = ThreadPoolEvaluator(models, n_threads = config['workers'])
+        elif config['evaluator'] == 'processes':
+            evaluator = MultiprocessingEvaluator(models, n_processes = config['workers'])
+        else:
+            evaluator = SequentialEvaluator(models)
+
+        # run the experiments
+        start = time.time()
+        with evaluator:
+            experiments, outcomes = evaluator.perform_experiments(scenarios = scenarios, policies = policies)
+        wall_time = time.time() - start
+
+        # collect the per-phase latencies from the trace
+        with open(trace_file) as fh:
+            records = [json.loads(line) for line in fh]
+        phases = {}
+        for phase in PHASES:
+            values = [record['phases'][phase] for record in records if phase in record['phases']]
+            if values:
+                phases[phase] = {f'p{q}': float(np.percentile(values, q)) for q in (50, 90, 99)}
+
+        # peak memory of this process, of the workers (per process that ran the models, this process for threads) and of the
+        # largest solver process (both sampled by the connector, RUSAGE_CHILDREN would count the forked interpreter of every solver), in MB
+        scale = 1024**2 if sys.platform == 'darwin' else 1024
+        main_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+        workers = {}
+        for record in records:
+            if record.get('worker_peak_rss_kb') is not None:
+                workers[record['pid']] = max(workers.get(record['pid'], 0), record['worker_peak_rss_kb'])
+        worker_rss = max(workers.values()) / 1024 if workers else float('nan')
+        total_worker_rss = sum(workers.values()) / 1024 if workers else float('nan')
+        solver_rss = [record['peak_rss_kb'] for record in records if record.get('peak_rss_kb') is not None]
+        solver_rss = max(solver_rss) / 1024 if solver_rss else float('nan')
+
+        return {**config,
+                'runs': len(experiments),
+                'wall_time': wall_time,
+                'runs_per_second': len(experiments) / wall_time,
+                'failed_runs': sum(record['failure'] is not None for record in records),
+                'phases': phases,
+                'main_peak_rss_mb': main_rss,
+                'worker_processes': len(workers),
+                'worker_peak_rss_mb': worker_rss,
+                'total_worker_peak_rss_mb': total_worker_rss,
+                'solver_peak_rss_mb': solver_rss}
+    finally:
+        os.chdir(curdir)
+        shutil.rmtree(workspace, ignore_errors = True)
+
+# define a function for printing the results as a table
+def print_results(results):
+    print(f'{"model":8} {"evaluator":11} {"workers":>7} {"runs":>6} {"runs/s":>8} {"solve p50":>10} {"solve p99":>10} {"overhead p50":>13} {"main MB":>8} {"worker MB":>9} {"workers MB":>10} {"solver MB":>9}')
+    for r in results:
+        overhead = sum(v['p50'] for k, v in r['phases'].items() if k != 'solve')
+        print(f'{r["model"]:8} {r["evaluator"]:11} {r["workers"]:>7} {r["runs"]:>6} {r["runs_per_second"]:>8.2f} '
+              f'{r["phases"]["solve"]["p50"]:>10.3f} {r["phases"]["solve"]["p99"]:>10.3f} {overhead:>13.3f} '
+              f'{r["main_peak_rss_mb"]:>8.0f} {r["worker_peak_rss_mb"]:>9.0f} {r["total_worker_peak_rss_mb"]:>10.0f} {r["solver_peak_rss_mb"]:>9.0f}')
+
+# define a function for comparing the throughput against a baseline (returns the regressions)
+def compare(results, baseline, tolerance):
+    reference = {(r['model'], r['evaluator'], r['workers']): r['runs_per_second'] for r in baseline}
+    regressions = []
+    for r in results:
+        key = (r['model'], r['evaluator'], r['workers'])
+        if key in reference and r['runs_per_second'] < (1 - tolerance) * reference[key]:
+            regressions.append(f'{key}: {r["runs_per_second"]:.2f} runs/s, baseline {reference[key]:.2f} runs/s')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark the Linny-R connector with a stand-in solver')
+    parser.add_argument('--model', choices = ['base', 'botlek'], default = 'botlek')
+    parser.add_argument('--evaluators', default = 'sequential,threads,processes', help = 'comma separated: sequential, threads, processes')
+    parser.add_argument('--workers', default = '1,4', help = 'comma separated numbers of threads/processes')
+    parser.add_argument('--experiments', type = int, default = 40, help = 'approximate number of runs per configuration')
+    parser.add_argument('--models', dest = 'n_models', type = int, default = 2, help = 'number of (week) models')
+    parser.add_argument('--delay', type = float, default = 0.1, help = 'solve time of the stand-in solver in seconds')
+    parser.add_argument('--rows', type = int, default = 672, help = 'number of time steps in the solver output')
+    parser.add_argument('--output', help = 'save the results as JSON')
+    parser.add_argument('--baseline', help = 'JSON results of an earlier benchmark to compare against')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed relative drop in runs/second')
+    parser.add_argument('--run-one', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # run a single configuration and report it to the parent process
+    if args.run_one:
+        print(json.dumps(run_one(json.loads(args.run_one))))
+        return 0
+
+    # run every configuration in a fresh process
+    results = []
+    for evaluator in args.evaluators.split(','):
+        for workers in ([1] if evaluator == 'sequential' else [int(w) for w in args.workers.split(',')]):
+            config = {'model': args.model, 'evaluator': evaluator, 'workers': workers, 'experiments': args.experiments,
+                      'n_models': args.n_models, 'delay': args.delay, 'rows': args.rows}
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-one', json.dumps(config)],
+                                    stdout = subprocess.PIPE, check = True, text = True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent = 2)
+
+    # fail if the throughput dropped compared to the baseline
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+'''
+Bulk writer for the experiment input files of Linny-R
+
+Writes the same file as csv.writer with zip_longest (';' delimited, '\r\n'
+line endings, scalar columns only filled in the first row), but formats the
+time series columns with NumPy run detection, so every run of identical values
+(an hour or a day of quarters) is converted to text only once. The header and
+the delimiters of the columns that are empty below the first row (constants,
+lever blocks) are rendered once per column layout into a row template that is
+reused for every following experiment, and the file is written in one call.
+
+'''
+
+# import required packages
+import csv, io
+import numpy as np
+
+# define a class for writing experiment input files
+class ExperimentWriter:
+
+    # create an instance of this class (float_format is a %-format like '%.10g', None for the shortest exact representation)
+    def __init__(self, float_format = None):
+        self.float_format = float_format
+
+        # cache of rendered headers and row templates per column layout
+        self._layouts = {}
+
+    # define a function for formatting a single value as csv.writer would
+    def _format_value(self, value):
+        if value is None:
+            return ''
+        if self.float_format is not None and isinstance(value, float):
+            return self.float_format % value
+        return str(value)
+
+    # define a function for formatting a time series column into a list of strings
+    def _format_column(self, values):
+
+        # floats are formatted once per run of identical values (most series are constant per hour or per day)
+        if all(isinstance(value, float) for value in values):
+            array = np.asarray(values, dtype = float)
+            bits = array.view(np.int64)
+            starts = np.flatnonzero(np.concatenate(([True], bits[1:] != bits[:-1])))
+            strings = np.array([self._format_value(value) for value in array[starts].tolist()], dtype = object)
+            return np.repeat(strings, np.diff(np.append(starts, len(array)))).tolist()
+
+        # anything else is formatted value by value
+        return [self._format_value(value) for value in values]
+
+    # define a function for the header and the row template of a column layout
+    def _layout(self, keys, series_positions):
+        layout_key = (keys, series_positions)
+        if layout_key not in self._layouts:
+
+            # render the header with the csv writer (takes care of quoting)
+            fh = io.StringIO()
+            csv.writer(fh, delimiter = ';').writerow(keys)
+            header = fh.getvalue()
+
+            # render the rows below the first as a template: the other columns are empty there, only delimiters remain
+            template = ''
+            previous = 0
+            for position in series_positions:
+                template += ';' * (position - previous) + '%s'
+                previous = position
+            template += ';' * (len(keys) - 1 - previous) + '\r\n'
+
+            self._layouts[layout_key] = (header, template)
+
+        return self._layouts[layout_key]
+
+    # define a function for writing an experiment dict to a file
+    def write(self, path, experiment):
+
+        keys = tuple(experiment.keys())
+        values = list(experiment.values())
+
+        # find the time series (list) columns and the number of rows
+        series_positions = tuple(j for j, value in enumerate(values) if isinstance(value, list))
+        n_rows = max([len(values[j]) for j in series_positions] + [1])
+        header, template = self._layout(keys, series_positions)
+
+        # format the time series columns and pad them to the same length
+        columns = {}
+        for j in series_positions:
+            column = self._format_column(values[j])
+            columns[j] = column + (n_rows - len(column)) * ['']
+
+        # render the first row with all columns
+        first_row = ';'.join(columns[j][0] if j in columns else self._format_value(values[j]) for j in range(len(values)))
+
+        # render the other rows with the template of the layout
+        rows = [template % row for row in zip(*[columns[j][1:] for j in series_positions])]
+
+        # write the file in one call
+        with open(path, 'w', newline = '') as fh:
+            fh.write(header + first_row + '\r\n' + ''.join(rows))
@@ -12,13 +12,19 @@ Created on Apr 15, 2020
 '''
 
 # import required packages
-import csv, subprocess, os, copy, math
+import csv, subprocess, os, shutil, signal, sys, tempfile
 import pandas as pd
 import numpy as np
 import time
-from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor
 from ema_workbench.em_framework.model import FileModel, SingleReplication
+from ema_workbench.em_framework.outcomes import ArrayOutcome
 from ema_workbench.util.ema_logging import method_logger
+from ema_workbench.util import CaseError, get_module_logger
+from experiment_writer import ExperimentWriter
+from run_metrics import RunMetrics, file_tail, read_peak_rss
+
+_logger = get_module_logger(__name__)
 
 # define a base class for interacting with Linny-R models
 class BaseLinnyRModel(FileModel):
@@ -34,82 +40,313 @@ class BaseLinnyRModel(FileModel):
         
         # define the path of the Linny-R executable
         self.linnyr = os.path.join(os.path.abspath('./software'), 'lrc.exe')
+
+        # optional on-disk cache with the results of earlier runs (a ResultCache instance, disabled by default)
+        self.result_cache = None
+
+        # define the folder in which the per-run scratch directories are created (None for the system temp folder, e.g. '/dev/shm' for tmpfs)
+        self.scratch_directory = None
+
+        # keep the scratch directory of every run for debugging (if things dont work out, have a look at the log file)
+        self.keep_scratch = False
+
+        # define the maximum wall-clock time of a single solver run in seconds (None for no limit)
+        self.timeout = None
+
+        # define how often a failed run (timeout, error exit code, no readable output) is retried and the delay before the first retry in seconds (doubled for every next one)
+        self.retries = 1
+        self.retry_backoff = 1.0
+
+        # treat a nonzero exit code of the Linny-R console as a failed run
+        self.check_exit_code = True
+
+        # report a run that failed all attempts as missing outcomes (CaseError) instead of NaN outcomes with 'Failed' set to 1
+        self.raise_on_failure = False
+
+        # define a dictionary for the shapes of the output variables of the last successful run
+        self._output_shapes = {}
+
+        # define the writer of the experiment input files (ExperimentWriter(float_format = '%.10g') for shorter files)
+        self.experiment_writer = ExperimentWriter()
+
+        # define the dtype of the parsed output variables (np.float32 halves the size of the results sent back from workers)
+        self.output_dtype = np.float64
+
+        # optional reuse of the generated LP across the experiments of a model and policy (an LPReuse instance, disabled by default)
+        self.lp_reuse = None
+
+        # define a JSONL file to which the metrics record of every run is appended (None to only log them at debug level)
+        self.trace_file = None
+
+    # define a function for waiting for a solver process and sampling its peak memory (on Linux)
+    def _wait_with_peak_rss(self, process):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        delay = 0.0005
+        peak_rss = None
+        while True:
+
+            # sample the high-water mark before the process is reaped (it is reset at exec, so unlike ru_maxrss it excludes the forked interpreter)
+            sample = read_peak_rss(process.pid)
+            if sample is not None:
+                peak_rss = sample if peak_rss is None else max(peak_rss, sample)
+
+            # reap the process when it has finished (a process that exits between two samples may have used more than reported)
+            if process.poll() is not None:
+                return process.returncode, peak_rss
+
+            # otherwise poll with an increasing interval until the deadline
+            remaining = 0.05 if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(process.args, self.timeout)
+            time.sleep(min(delay, remaining, 0.05))
+            delay *= 2
+
+    # define a function for running the Linny-R console (returns the exit code and peak memory in kB if known) and killing it (with its child solver processes) if it hangs
+    def _run_solver(self, args, cwd):
+
+        # start the solver in its own process group, so the whole tree can be killed
+        if os.name == 'nt':
+            process = subprocess.Popen(args, cwd = cwd, creationflags = subprocess.CREATE_NEW_PROCESS_GROUP)
+        else:
+            process = subprocess.Popen(args, cwd = cwd, start_new_session = True)
+
+        try:
+            if sys.platform.startswith('linux'):
+                return self._wait_with_peak_rss(process)
+            else:
+                return process.wait(timeout = self.timeout), None
+
+        except subprocess.TimeoutExpired:
+
+            # kill the process tree
+            if os.name == 'nt':
+                subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                                stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            raise
+
+    # define a function for a single attempt to solve the model, returns (None, results) or (a description of the failure, None)
+    def _solve(self, modelfile, scratch, metrics):
+
+        # execute Linny-R console using the experiment input file (inside the scratch directory)
+        with metrics.phase('solve'):
+            try:
+                exit_code, peak_rss = self._run_solver([self.linnyr, modelfile, self.experiment_file], scratch)
+            except subprocess.TimeoutExpired:
+                return f'killed after {self.timeout} seconds', None
+            except OSError as e:
+                return f'could not start {self.linnyr}: {e}', None
+        metrics.record['exit_code'] = exit_code
+        metrics.record['peak_rss_kb'] = peak_rss
+
+        # keep the end of the log file if the solver reported an error
+        if exit_code != 0:
+            metrics.record['log_tail'] = file_tail(os.path.join(scratch, f'{modelfile}_exp.log'))
+            if self.check_exit_code:
+                return f'exit code {exit_code}', None
+
+        # read the results from the output file
+        with metrics.phase('parse'):
+            try:
+                results = self._read_results(os.path.join(scratch, f'{modelfile}_exp.csv'))
+            except (OSError, ValueError, StopIteration) as e:
+                return f'no readable output ({type(e).__name__}: {e})', None
+
+        # remember the shape of every output variable, so failed runs can be filled with NaN of the same shape
+        self._output_shapes.update({variable: np.shape(values) for variable, values in results.items()})
+        return None, results
+
+    # define a function for removing the output files of a failed attempt
+    def _remove_outputs(self, scratch, modelfile):
+        for extension in ['csv', 'lp', 'log']:
+            try:
+                os.remove(os.path.join(scratch, f'{modelfile}_exp.{extension}'))
+            except OSError:
+                pass
+
+    # define a function for the results of a failed run: NaN for every output variable (in the shape of the last successful run) and the failure flag
+    def _failed_results(self, model_file, failure, experiment):
+        results = {variable: np.full(shape, np.nan, dtype = self.output_dtype) for variable, shape in self._output_shapes.items()}
+
+        # without an earlier successful run the shape of array outcomes is unknown, so report missing outcomes instead
+        missing = (self._required_columns() or set()) - results.keys()
+        if missing:
+            if any(isinstance(outcome, ArrayOutcome) and set(outcome.variable_name) - {'Run-time', 'Failed'} for outcome in self.outcomes):
+                raise CaseError(f'Linny-R run of {self.name} ({model_file}) failed: {failure}', experiment)
+            results.update({variable: np.nan for variable in missing})
+
+        results['Failed'] = np.float64(1.0)
+        return results
+
+    # define a function for creating an isolated scratch directory for one run with the model file in it
+    def _create_scratch(self, model_file):
+
+        # create a uniquely named directory
+        scratch = tempfile.mkdtemp(prefix = f'{self.name}_', dir = self.scratch_directory)
+
+        # make the model file available in it (hard link if possible, otherwise a copy)
+        source = os.path.join(self.working_directory, model_file)
+        target = os.path.join(scratch, model_file)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+        return scratch
+
+    # define a function for writing the experiment dict to a csv input file readable by Linny-R
+    def _write_experiment(self, experiment, path):
+
+        # lists are written as time series columns, other values only in the first row (as csv.writer with zip_longest)
+        self.experiment_writer.write(path, experiment)
+
+    # define a function for the output columns that are needed for the outcomes (None if all columns are needed)
+    def _required_columns(self):
+        required = {variable for outcome in self.outcomes for variable in outcome.variable_name} - {'Run-time', 'Failed'}
+        return required if required else None
+
+    # define a function for reading the Linny-R output file into a results dict
+    def _read_results(self, path):
+
+        # read the variable names from the first row
+        with open(path, newline = '') as fh:
+            header = next(csv.reader(fh, delimiter = ';'))
+
+        # only parse the columns needed for the outcomes (or all except the time variable if none are declared or found)
+        required = self._required_columns()
+        columns = [i for i in header if required is not None and i in required]
+        if not columns:
+            columns = [i for i in header if i != 'T']
+        usecols = [header.index(i) for i in columns]
+
+        # parse the selected columns straight into a numeric array
+        try:
+            data = np.loadtxt(path, delimiter = ';', skiprows = 1, usecols = usecols, dtype = self.output_dtype, ndmin = 2)
+
+        # fall back to pandas for files numpy cannot parse (e.g. empty cells)
+        except ValueError:
+            data = pd.read_csv(path, delimiter = ';', usecols = columns, dtype = self.output_dtype)[columns].to_numpy()
+
+        # fill in the dictionary with the values of every variable
+        return {i: np.ascontiguousarray(data[:, j]) for j, i in enumerate(columns)}
         
+    # define a function for starting the metrics record of a run
+    def _new_metrics(self, experiment):
+        return RunMetrics(self.name, getattr(experiment, 'name', None))
+
+    # define a function for emitting the metrics record of a run
+    def _emit_metrics(self, metrics):
+        metrics.record['worker_peak_rss_kb'] = read_peak_rss(metrics.record['pid'])
+        _logger.debug(f'metrics of {self.name}: {metrics.record}')
+        if self.trace_file is not None:
+            metrics.write(self.trace_file)
+
     # define a function for running an experiment
     @method_logger(__name__)
     def run_experiment(self, experiment):
-        
-        # create a csv input file readable by Linny-R from the experiment dict
-        with open(os.path.join(self.working_directory, self.experiment_file), 'w', newline = '') as fh:
-            
-            # define the csv writer
-            w = csv.writer(fh, delimiter = ';')
-            
-            # write the variables names to the first row
-            w.writerow(experiment.keys())
-            
-            # create a list of values where if item not already a list, make it a list (paramount for zip_longest function)
-            values = [[i] if isinstance(i,list) == False else i for i in experiment.values()]
-            
-            # write the transposed values list to the next rows (works for timeseries and accounts for empty cells)
-            w.writerows(zip_longest(*values, fillvalue = ''))
-            
+        return self._run_linnyr(experiment, self.model_file, self._new_metrics(experiment))
+
+    # define a function for running an experiment on a model file (in its own scratch directory, so runs can execute concurrently)
+    def _run_linnyr(self, experiment, model_file, metrics):
+        metrics.record['model_file'] = model_file
+
         # define the file of the model object and strip off '.lnr' part so Linny-R can find it        
-        modelfile = self.model_file[:-4]
+        modelfile = model_file[:-4]
 
-        # save the path of the current working directory as a variable
-        curdir = os.getcwd()
+        # create an isolated scratch directory for this run
+        scratch = self._create_scratch(model_file)
 
-        # temporarily change the working directory to the model folder
-        os.chdir(self.working_directory)
+        try:
         
-        # start timer
-        start = time.time()
-        
-        # execute Linny-R console using the experiment input file
-        subprocess.call([self.linnyr, modelfile, self.experiment_file])
-        
-        # end timer
-        end = time.time()
+            # create a csv input file readable by Linny-R from the experiment dict
+            experiment_file = os.path.join(scratch, self.experiment_file)
+            with metrics.phase('write'):
+                self._write_experiment(experiment, experiment_file)
 
-        # calculate the run-time in seconds
-        run_time = end - start
+            # return the cached results if this model, input and solver were run before
+            if self.result_cache is not None:
+                start = time.time()
+                with metrics.phase('cache'):
+                    cache_key = self.result_cache.key(os.path.join(self.working_directory, model_file), experiment_file, self.linnyr)
+                    results = self.result_cache.get(cache_key)
+                required = self._required_columns() or set()
+                if results is not None and required <= results.keys():
+                    metrics.record['cached'] = True
 
-        # change the working directory back to the orginal
-        os.chdir(curdir)
+                    # the run-time of a cached run is the time of the lookup
+                    results['Run-time'] = np.array(time.time() - start)
+                    results['Failed'] = np.float64(0.0)
+                    return results
 
-        # locate and define the output file
-        outputfile = os.path.join(self.working_directory, f'{modelfile}_exp.csv')
-        
-        # read the data from the output file into a dataframe
-        data = pd.read_csv(outputfile, delimiter = ';')
-                         
-        # create an empty dictionary for the results
-        results = {}
-                         
-        # loop trough the output variables                
-        for i in data.columns:
-                         
-            # skip the time variable           
-            if i == 'T':
-                continue
-                         
-            # fill in the dictionary with the values in a tuple         
+            # solve a patched copy of the kept LP of this model and policy instead of running Linny-R (if its mapping is learned)
+            # (the experiment that its mapping is learned from gets the outputs of the Linny-R run used for learning)
+            lp_results, lp_mode = None, None
+            if self.lp_reuse is not None:
+                start = time.time()
+                with metrics.phase('lp'):
+                    lp_results, lp_mode = self.lp_reuse.run(self, experiment, model_file)
+                if lp_results is not None and lp_mode != 'check':
+                    metrics.record['lp_reused'] = lp_mode == 'reused'
+                    lp_results['Run-time'] = np.array(time.time() - start)
+                    lp_results['Failed'] = np.float64(0.0)
+                    return lp_results
+            
+            # run the solver, retrying failed runs after an increasing delay
+            start = time.time()
+            for attempt in range(self.retries + 1):
+                if attempt > 0:
+                    time.sleep(self.retry_backoff * 2**(attempt - 1))
+                    self._remove_outputs(scratch, modelfile)
+                metrics.record['attempts'] = attempt + 1
+                failure, results = self._solve(modelfile, scratch, metrics)
+                if failure is None:
+                    break
+                _logger.warning(f'Linny-R run of {self.name} ({model_file}) failed on attempt {attempt + 1} of {self.retries + 1}: {failure}')
+
+            # all attempts failed: report missing outcomes (CaseError) or return NaN outcomes flagged as failed
             else:
-                results[i] = np.array(data[i])
-                
-        results['Run-time'] = np.array(run_time)
-                
-        # delete the csv input file
-        os.remove(os.path.join(self.working_directory, self.experiment_file))
+                metrics.record['failure'] = failure
+                if metrics.record['log_tail'] is None:
+                    metrics.record['log_tail'] = file_tail(os.path.join(scratch, f'{modelfile}_exp.log'))
+                if self.raise_on_failure:
+                    raise CaseError(f'Linny-R run of {self.name} ({model_file}) failed: {failure}', experiment)
+                results = self._failed_results(model_file, failure, experiment)
+                results['Run-time'] = np.array(time.time() - start)
+                return results
 
-        # delete the output files (if things dont work out, have a look at the log file)
-        os.remove(os.path.join(self.working_directory, f'{modelfile}_exp.csv'))
-        os.remove(os.path.join(self.working_directory, f'{modelfile}_exp.lp'))
-        os.remove(os.path.join(self.working_directory, f'{modelfile}_exp.log'))
+            # cross-check the results of the patched LP with those of Linny-R (which are returned)
+            if lp_results is not None:
+                self.lp_reuse.cross_check(self, experiment, model_file, lp_results, results)
 
-        # return the results
-        return results
+            # calculate the run-time in seconds (of all attempts)
+            results['Run-time'] = np.array(time.time() - start)
+            results['Failed'] = np.float64(0.0)
+
+            # store the results for later runs with the same model, input and solver
+            if self.result_cache is not None:
+                with metrics.phase('cache'):
+                    self.result_cache.put(cache_key, {variable: values for variable, values in results.items() if variable not in ('Run-time', 'Failed')})
+
+            # return the results
+            return results
+
+        except Exception:
+
+            # keep the end of the log file of a failed run
+            if metrics.record['log_tail'] is None:
+                metrics.record['log_tail'] = file_tail(os.path.join(scratch, f'{modelfile}_exp.log'))
+            raise
+
+        finally:
+
+            # delete the scratch directory with the input, output, lp and log files
+            with metrics.phase('cleanup'):
+                if not self.keep_scratch:
+                    shutil.rmtree(scratch, ignore_errors = True)
+
+            self._emit_metrics(metrics)
 
 # define the base class
 class LinnyRModel(SingleReplication, BaseLinnyRModel):
@@ -117,13 +354,71 @@ class LinnyRModel(SingleReplication, BaseLinnyRModel):
 
 # extension (subclass) of Linny-R connector class, specifically for the Thesis of Rob Roos (2020)
 
-# import two functions for getting characteristic week data for shorter run-time
-from functions import get_ten_week_list, get_naoh_average_ten_week_list
+# import the shared reference data store
+from reference_data import get_reference_data
+
+# import the cache for generated series
+from series_cache import SeriesCache
+
+# import the vectorized time series engine
+from time_series import scaled_ramp, interpolated_ramp, linear_ramp, sinusoid, with_default, CharacteristicWeeks
+
+# define the characteristic weeks (wrapped once per process, so the selected indices are determined once and shared by all models)
+_characteristic_weeks = None
+
+# define a function for getting the characteristic weeks and NaOH characteristic weeks (the functions module is only needed by the Botlek model)
+def get_characteristic_weeks():
+    global _characteristic_weeks
+    if _characteristic_weeks is None:
+
+        # import two functions for getting characteristic week data for shorter run-time
+        from functions import get_ten_week_list, get_naoh_average_ten_week_list
+        _characteristic_weeks = (CharacteristicWeeks(get_ten_week_list), CharacteristicWeeks(get_naoh_average_ten_week_list))
+    return _characteristic_weeks
+
+# create the process wide cache of generated series (shared by all models and threads, not pickled with the models)
+series_cache = SeriesCache()
+
+# define the bounds of the Linny-R model per lever of the Botlek model: {lever: {True: bounds if realised, False: bounds if not}}
+# (a new option only needs an entry here and a BooleanParameter with the same variable name)
+BOTLEK_LEVER_BOUNDS = {
+    'steam_pipe': {True: {'Option: transport to Nouryon (Steam pipe owner):UB': 7.5,
+                          'FUTURE: transport 5210 site (Steam pipe owner):UB': 30,
+                          'Financiering Steam Pipe (Steam pipe owner):LB': 1,
+                          'Financiering Steam Pipe (Steam pipe owner):UB': 1},
+                   False: {'Option: transport to Nouryon (Steam pipe owner):UB': 0,
+                           'FUTURE: transport 5210 site (Steam pipe owner):UB': 0,
+                           'Financiering Steam Pipe (Steam pipe owner):LB': 0,
+                           'Financiering Steam Pipe (Steam pipe owner):UB': 0}},
+    'e_boiler': {True: {'Electrode boiler 50 bar 2/7 aFRR (Air Liquide):UB': 5,
+                        'electrode boiler 50 bar 5/7 inzetbaar (Air Liquide):UB': 17.5,
+                        'by-pass aFRR (ghost actor):UB': 0,
+                        'AL 50 bar fixed rate (Air Liquide):LB': 22.5,
+                        'AL 50 bar fixed rate (Air Liquide):UB': 22.5,
+                        'DA inkoop EB70 (Air Liquide):UB': 6,
+                        'Cogen A Gasturbine (Air Liquide):UB': 0,
+                        'Cogen A Brander (Air Liquide):UB': 0,
+                        'Cogen B gasturbine (Air Liquide):UB': 0,
+                        'Cogen B Brander (Air Liquide):UB': 0},
+                 False: {'Electrode boiler 50 bar 2/7 aFRR (Air Liquide):UB': 0,
+                         'electrode boiler 50 bar 5/7 inzetbaar (Air Liquide):UB': 0,
+                         'by-pass aFRR (ghost actor):UB': 5,
+                         'AL 50 bar fixed rate (Air Liquide):LB': 0,
+                         'AL 50 bar fixed rate (Air Liquide):UB': 0,
+                         'DA inkoop EB70 (Air Liquide):UB': 0,
+                         'Cogen A Gasturbine (Air Liquide):UB': 0,
+                         'Cogen A Brander (Air Liquide):UB': 32.5,
+                         'Cogen B gasturbine (Air Liquide):UB': 0,
+                         'Cogen B Brander (Air Liquide):UB': 32.5}},
+    'chlorine_storage': {True: {'stored CL2 (Nouryon):UB': 3200,
+                                'stored CL2 (Nouryon):InSt': 3200},
+                         False: {'stored CL2 (Nouryon):UB': 1600,
+                                 'stored CL2 (Nouryon):InSt': 1600}}}
 
 class LinnyRModel_Botlek(LinnyRModel):
     
-    # create an instance of this class
-    def __init__(self, name, wd=None, model_file=None):
+    # create an instance of this class (optionally with a folder for a memory-mapped .npy cache of the reference data)
+    def __init__(self, name, wd=None, model_file=None, reference_cache_directory=None):
         
         # inherit properties from the base class (the generic Linny-R connector)
         super().__init__(name, wd, model_file)
@@ -134,17 +429,18 @@ class LinnyRModel_Botlek(LinnyRModel):
         # define the number of time steps (quarters) in that time horizon
         self.time_steps = 35040 * self.time_horizon
 
-        # create a dictionary for the time serie reference scenarios
-        electricity_data = pd.read_csv('./data/imbalance_market_electricity_data.csv')
-        self.reference_time_series = {'Unbal opregelen:Price':list(electricity_data['invoeden_EURMWh']), 
-                                      'Unbal afregelen:Price':list(electricity_data['afnemen_EURMWh']),
-                                      'Unbal opregelen:UB':list(electricity_data['imbalance_demand']),
-                                      'Unbal afregelen:LB':list(electricity_data['imbalance_supply'])}
-        
-        # import 2019 and 2030 forecast data for hourly day-ahead electricity prices
-        day_ahead_data = pd.read_csv('./data/day_ahead_market_electricity_data.csv')
-        self.day_ahead_2019 = list(day_ahead_data['Data_2019'])
-        self.day_ahead_2030 = list(day_ahead_data['Data_2030'])
+        # only evaluate the time series at the quarters of the characteristic weeks instead of the full horizon
+        self.sparse_evaluation = True
+
+        # reuse the series generated for the same sampled value across policies and week models (process wide cache)
+        self.cache_series = True
+
+        # define the folder with the reference data and the folder for its .npy cache
+        self.data_directory = os.path.abspath('./data')
+        self.reference_cache_directory = reference_cache_directory
+
+        # get the reference time series from the shared store (loaded once per process)
+        self._load_reference_data()
 
         # create a dictionary for current values
         self.current_values = {'natural gas market:Price':0.28,
@@ -153,50 +449,89 @@ class LinnyRModel_Botlek(LinnyRModel):
         
         # create a list with the constants
         self.constant_list = ['Capex E-boiler:Price', 'OPEX E-BOILER:Price', 'CAPEX Steam Pipe:Price']
+
+        # define the bounds that every lever (Power-to-X option) sets in the Linny-R model, if it is (not) realised
+        self.lever_bounds = BOTLEK_LEVER_BOUNDS
+
+        # create a dictionary for the merged bounds of every policy (compiled on first use)
+        self._compiled_policies = {}
     
+    # define a function for getting the reference time series from the shared store
+    def _load_reference_data(self):
+
+        # create a dictionary for the time serie reference scenarios
+        electricity_data = get_reference_data('imbalance_market_electricity_data.csv', self.data_directory, self.reference_cache_directory,
+                                              ['invoeden_EURMWh', 'afnemen_EURMWh', 'imbalance_demand', 'imbalance_supply'])
+        self.reference_time_series = {'Unbal opregelen:Price':electricity_data['invoeden_EURMWh'], 
+                                      'Unbal afregelen:Price':electricity_data['afnemen_EURMWh'],
+                                      'Unbal opregelen:UB':electricity_data['imbalance_demand'],
+                                      'Unbal afregelen:LB':electricity_data['imbalance_supply']}
+        
+        # import 2019 and 2030 forecast data for hourly day-ahead electricity prices
+        day_ahead_data = get_reference_data('day_ahead_market_electricity_data.csv', self.data_directory, self.reference_cache_directory,
+                                            ['Data_2019', 'Data_2030'])
+        self.day_ahead_2019 = day_ahead_data['Data_2019']
+        self.day_ahead_2030 = day_ahead_data['Data_2030']
+
+    # leave the reference data out when the model is pickled to a worker process
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ['reference_time_series', 'day_ahead_2019', 'day_ahead_2030']:
+            state.pop(key, None)
+        return state
+
+    # and get it from the shared store of the worker process when unpickled
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load_reference_data()
+
     # define a function for running an experiment
+    @method_logger(__name__)
     def run_experiment(self, experiment):
+
+        # turn the sampled experiment into input data (timed as the series phase)
+        metrics = self._new_metrics(experiment)
+        with metrics.phase('series'):
+            prepared = self.prepare_experiment(experiment)
+
+        # let the base class (generic Linny-R connector) run an experiment using the modified data and return results
+        return self._run_linnyr(prepared, self.model_file, metrics)
+
+    # define a function for the bounds of a policy: the blocks of its options are merged once and reused for every scenario
+    def _policy_bounds(self, levers):
+        if levers not in self._compiled_policies:
+            bounds = {}
+            for lever, value in levers:
+                bounds.update(self.lever_bounds[lever][value])
+            self._compiled_policies[levers] = bounds
+        return self._compiled_policies[levers]
+
+    # define a function for getting a generated series from the scenario series cache (or building it)
+    def _series(self, variable, value, build):
+        if not self.cache_series:
+            return build()
+        return series_cache.get_or_compute((self.data_directory, variable, value, self.time_horizon), build)
+
+    # define a function for turning the sampled experiment into the input data of the Linny-R model
+    def prepare_experiment(self, experiment):
         
-        # deep copy the experiment dict
-        experiment = copy.deepcopy(experiment)
-        
-        # create an empty dict for the lever values
-        d = {}
+        # split the levers from the uncertainties (the new dict replaces the deep copy, the sampled values are scalars)
+        levers = tuple((i, experiment[i] == True) for i in experiment.keys() if i in self.lever_bounds)
+        experiment = {i: value for i, value in experiment.items() if i not in self.lever_bounds}
+        ten_weeks, naoh_ten_weeks = get_characteristic_weeks()
         
         # modify the sampled experiment data accordingly
         for i in experiment.keys():
             
             # if the variable is a factor to establish time series for the imbalance market data
             if i in self.reference_time_series.keys():
-                factor = experiment[i]
-                empty_list = []
-                data = self.reference_time_series[i]
-                for year in range(1, self.time_horizon + 1):
-                    for value in data:
-                        dif = (value * factor) - value
-                        step = dif / self.time_horizon
-                        est = value + (step * year)
-                        empty_list.append(est)
-                ten_week_list = get_ten_week_list(empty_list)
-                rounded_mean = round(np.mean(ten_week_list), 0)
-                ten_week_list.insert(0, rounded_mean) # default value is rounded mean
-                experiment[i] = ten_week_list
+                build = lambda: with_default(ten_weeks.evaluate(scaled_ramp, self.time_steps, self.reference_time_series[i], experiment[i], self.time_horizon, sparse = self.sparse_evaluation))
+                experiment[i] = self._series(i, experiment[i], build) # default value is rounded mean
                
             # if the variable is the factor for the day-ahead electricity price in 2030
             if i == 'E day-ahead:Price':
-                factor = experiment[i]
-                empty_list = []
-                for year in range(1, self.time_horizon + 1):
-                    for value_2019, value_2030 in zip(self.day_ahead_2019, self.day_ahead_2030):
-                        dif = (value_2030 * factor) - value_2019
-                        step = dif / self.time_horizon
-                        hour_est = value_2019 + (step * year)
-                        quarter_list = 4 * [hour_est]
-                        empty_list.extend(quarter_list)
-                ten_week_list = get_ten_week_list(empty_list)
-                rounded_mean = round(np.mean(ten_week_list), 0)
-                ten_week_list.insert(0, rounded_mean) # default value is rounded mean
-                experiment[i] = ten_week_list
+                build = lambda: with_default(ten_weeks.evaluate(interpolated_ramp, self.time_steps, self.day_ahead_2019, self.day_ahead_2030, experiment[i], self.time_horizon, sparse = self.sparse_evaluation))
+                experiment[i] = self._series(i, experiment[i], build) # default value is rounded mean
                 
             # if the variable is the future value in 2030 to calculate gradient for linear function
             elif i in self.current_values.keys():
@@ -209,91 +544,84 @@ class LinnyRModel_Botlek(LinnyRModel):
                     current_value = self.current_values[i]
                     future_value = experiment[i]
                 
-                days = self.time_horizon * 365
-                gradient =  (future_value - current_value) / days
-                day_list = [ gradient * x + current_value for x in range(1, days + 1) ]
-                empty_list = []
-                for day_est in day_list:
-                    quarter_list = 4 * 24 * [day_est]
-                    empty_list.extend(quarter_list)
-                ten_week_list = get_ten_week_list(empty_list)
-                rounded_mean = round(np.mean(ten_week_list), 0)
-                ten_week_list.insert(0, rounded_mean) # default value is rounded mean
-                experiment[i] = ten_week_list
+                build = lambda: with_default(ten_weeks.evaluate(linear_ramp, self.time_steps, current_value, future_value, self.time_horizon, sparse = self.sparse_evaluation))
+                experiment[i] = self._series(i, experiment[i], build) # default value is rounded mean
             
             # if the variable is the cyclical frequency (per year) of the NaOH sinus curve
             elif i == 'NaOH 50%:Price':
-                cyclical_freq = experiment[i] / 365
-                days = self.time_horizon * 365
-                t = np.arange(days)
-                day_list = list(450 * np.sin(cyclical_freq * 2 * math.pi * t) + 550)
-                empty_list = []
-                for daily_value in day_list:
-                    empty_list.extend(24 * 4 * [daily_value])
-                ten_week_list = get_naoh_average_ten_week_list(empty_list)
-                rounded_mean = round(np.mean(ten_week_list), 0)
-                ten_week_list.insert(0, rounded_mean) # default value is rounded mean
-                experiment[i] = ten_week_list
+                build = lambda: with_default(naoh_ten_weeks.evaluate(sinusoid, self.time_steps, experiment[i], self.time_horizon, sparse = self.sparse_evaluation))
+                experiment[i] = self._series(i, experiment[i], build) # default value is rounded mean
             
             # if the variable is a constant (CAPEX, OPEX)
             elif i in self.constant_list:
                 continue
-                
-            # if the variable is the Steam Pipe alternative boolean
-            elif i == 'steam_pipe':
-                if experiment[i] == True:
-                    d['Option: transport to Nouryon (Steam pipe owner):UB'] = 7.5
-                    d['FUTURE: transport 5210 site (Steam pipe owner):UB'] = 30
-                    d['Financiering Steam Pipe (Steam pipe owner):LB'] = 1
-                    d['Financiering Steam Pipe (Steam pipe owner):UB'] = 1
-                else:
-                    d['Option: transport to Nouryon (Steam pipe owner):UB'] = 0
-                    d['FUTURE: transport 5210 site (Steam pipe owner):UB'] = 0
-                    d['Financiering Steam Pipe (Steam pipe owner):LB'] = 0
-                    d['Financiering Steam Pipe (Steam pipe owner):UB'] = 0
-                    
-            # if the variable is the E-boiler alternative boolean
-            elif i == 'e_boiler':
-                if experiment[i] == True:
-                    d['Electrode boiler 50 bar 2/7 aFRR (Air Liquide):UB'] = 5
-                    d['electrode boiler 50 bar 5/7 inzetbaar (Air Liquide):UB'] = 17.5
-                    d['by-pass aFRR (ghost actor):UB'] = 0
-                    d['AL 50 bar fixed rate (Air Liquide):LB'] = 22.5
-                    d['AL 50 bar fixed rate (Air Liquide):UB'] = 22.5
-                    d['DA inkoop EB70 (Air Liquide):UB'] = 6
-                    d['Cogen A Gasturbine (Air Liquide):UB'] = 0
-                    d['Cogen A Brander (Air Liquide):UB'] = 0
-                    d['Cogen B gasturbine (Air Liquide):UB'] = 0
-                    d['Cogen B Brander (Air Liquide):UB'] = 0
-               
-                else:
-                    d['Electrode boiler 50 bar 2/7 aFRR (Air Liquide):UB'] = 0
-                    d['electrode boiler 50 bar 5/7 inzetbaar (Air Liquide):UB'] = 0
-                    d['by-pass aFRR (ghost actor):UB'] = 5
-                    d['AL 50 bar fixed rate (Air Liquide):LB'] = 0
-                    d['AL 50 bar fixed rate (Air Liquide):UB'] = 0
-                    d['DA inkoop EB70 (Air Liquide):UB'] = 0
-                    d['Cogen A Gasturbine (Air Liquide):UB'] = 0
-                    d['Cogen A Brander (Air Liquide):UB'] = 32.5
-                    d['Cogen B gasturbine (Air Liquide):UB'] = 0
-                    d['Cogen B Brander (Air Liquide):UB'] = 32.5
-                    
-            # if the variable is the Chlorine Storage alternative boolean
-            elif i == 'chlorine_storage':
-                if experiment[i] == True:
-                    d['stored CL2 (Nouryon):UB'] = 3200
-                    d['stored CL2 (Nouryon):InSt'] = 3200
-                else:
-                    d['stored CL2 (Nouryon):UB'] = 1600
-                    d['stored CL2 (Nouryon):InSt'] = 1600
-        
-        # delete the now useless lever variables
-        experiment.pop('steam_pipe')
-        experiment.pop('e_boiler')
-        experiment.pop('chlorine_storage')
 
-        # merge the experiment dict with the level dict
-        experiment = {**experiment, **d}
-        
-        # let the base class (generic Linny-R connector) run an experiment using this modified data and return results
-        return super().run_experiment(experiment)
\ No newline at end of file
+        # add the bounds of the selected options (one precompiled block per policy)
+        return {**experiment, **self._policy_bounds(levers)}
+
+# batched version of the Botlek model: all characteristic weeks of one perspective in a single experiment
+class LinnyRModel_Botlek_Batch(LinnyRModel_Botlek):
+
+    # create an instance of this class from the list of week model files (all in the same working directory)
+    def __init__(self, name, wd=None, model_files=None, reference_cache_directory=None):
+
+        # the first week model acts as the model file of the workbench model
+        super().__init__(name, wd, model_files[0], reference_cache_directory)
+
+        # define the model files of the weeks
+        self.model_files = list(model_files)
+
+        # define how many weeks of a year every characteristic week represents (for the annual outcomes)
+        self.week_weights = len(self.model_files) * [52 / len(self.model_files)]
+
+        # define the number of week models that are solved in parallel
+        self.n_parallel_weeks = len(self.model_files)
+
+    # define a function for the output columns needed for the outcomes (the week and annual variables derive from them)
+    def _required_columns(self):
+        required = set()
+        for variable in [variable for outcome in self.outcomes for variable in outcome.variable_name]:
+            base, _, suffix = variable.rpartition(' ')
+            if suffix == 'annual' or (suffix.startswith('week') and suffix[4:].isdigit()):
+                variable = base
+            if variable not in ('Run-time', 'Failed'):
+                required.add(variable)
+        return required if required else None
+
+    # define a function for running an experiment on all week models
+    @method_logger(__name__)
+    def run_experiment(self, experiment):
+
+        # prepare the input data once for all weeks
+        metrics = self._new_metrics(experiment)
+        with metrics.phase('series'):
+            experiment = self.prepare_experiment(experiment)
+
+        # start timer
+        start = time.time()
+
+        # solve the week models in parallel
+        with ThreadPoolExecutor(max_workers = self.n_parallel_weeks) as pool:
+            week_results = list(pool.map(lambda model_file: self._run_linnyr(experiment, model_file, metrics.copy()), self.model_files))
+
+        # create a dictionary for the results
+        results = {}
+
+        # store the results of every week
+        for week, week_result in enumerate(week_results, 1):
+            for variable, values in week_result.items():
+                results[f'{variable} week{week}'] = values
+
+        # combine the weeks into one series and an annual total for every output variable
+        for variable in week_results[0].keys():
+            if variable in ('Run-time', 'Failed'):
+                continue
+            results[variable] = np.concatenate([np.atleast_1d(r[variable]) for r in week_results])
+            results[f'{variable} annual'] = sum(w * np.sum(r[variable]) for w, r in zip(self.week_weights, week_results))
+
+        # the run-time of the whole batch, failed if any of the weeks failed
+        results['Run-time'] = np.array(time.time() - start)
+        results['Failed'] = np.float64(max(r.get('Failed', 0.0) for r in week_results))
+
+        # return the results
+        return results
@@ -0,0 +1,575 @@
+'''
+Reuse of the LP generated by Linny-R across experiments of the same model
+
+Linny-R builds the LP of a model from the .lnr file and the experiment input
+for every run, although between the scenarios of one model and policy only
+coefficients and bounds change (prices and scaled time series). In the LP
+reuse mode the connector learns once per model file and policy:
+
+- which entries of the LP (objective coefficients, constraint coefficients,
+  right-hand sides and bounds) depend on which cell of the experiment input,
+  by running Linny-R on the experiment and on two probes in which every
+  numeric input cell is perturbed by a known amount (an entry that depends on
+  a single cell changes in proportion to its perturbation, and the ratio of
+  the two perturbations identifies the cell); if that is ambiguous, every
+  input column is probed separately
+- which LP variable every value of the required output variables equals, by
+  solving the LPs of these runs with HiGHS (scipy) and matching the solutions
+  with the outputs of Linny-R
+
+Learning takes three Linny-R runs, or one plus two per numeric input column if
+the joint probes are ambiguous (up to max_probes probe runs, otherwise the
+model is left to Linny-R). The experiment that triggers it gets the outputs
+of its own Linny-R run, and the other experiments of that model and policy
+are run by Linny-R while it is learned, so threads never wait for it.
+
+Every next experiment patches only the changed entries of the kept LP, solves
+it with HiGHS and reads the output variables from the solution. The solves of
+every learned model until a first cross-check succeeds, and every check_every-th
+one after that, are cross-checked against a normal Linny-R run of the
+connector (with its retries and failure handling); a mismatch (e.g. an
+alternative optimum, or an input that enters the LP nonlinearly) switches the
+reuse off for that model and policy. Models and policies for which the
+mapping cannot be learned (including learning runs that time out or fail) are
+run by Linny-R as before.
+
+The LP is read in the CPLEX LP format. The learned mappings can be kept in a
+folder, so worker processes and later campaigns do not learn them again.
+
+'''
+
+# import required packages
+import hashlib, os, pickle, re, shutil, subprocess, tempfile, threading
+import numpy as np
+from result_cache import file_hash
+from ema_workbench.util import get_module_logger
+
+# the HiGHS solver of scipy is optional (only needed for the LP reuse mode)
+try:
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    from scipy.sparse import csr_matrix
+except ImportError:
+    milp = None
+
+_logger = get_module_logger(__name__)
+
+# define the section keywords of the CPLEX LP format
+_SECTIONS = {'minimize': 'min', 'minimise': 'min', 'minimum': 'min', 'min': 'min',
+             'maximize': 'max', 'maximise': 'max', 'maximum': 'max', 'max': 'max',
+             'subject to': 'st', 'such that': 'st', 'st': 'st', 's.t.': 'st', 'st.': 'st',
+             'bounds': 'bounds', 'bound': 'bounds',
+             'general': 'int', 'generals': 'int', 'gen': 'int',
+             'binary': 'bin', 'binaries': 'bin', 'bin': 'bin',
+             'end': 'end'}
+
+# define the tokens of the CPLEX LP format (operators, numbers and names)
+_TOKEN = re.compile(r'<=|>=|=<|=>|[<>=]|[+-]|:|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?(?![\w.])|[^\s<>=+:\-]+')
+
+# define the operators of the CPLEX LP format in normal form and mirrored (for 'l <= x')
+_OPERATORS = {'<=': '<=', '=<': '<=', '<': '<=', '>=': '>=', '=>': '>=', '>': '>=', '=': '='}
+_MIRRORED = {'<=': '>=', '>=': '<=', '=': '='}
+
+# define a function for converting a token to a number (None if it is not a number)
+def _number(token):
+    if token.lower() in ('inf', 'infinity'):
+        return np.inf
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+# define a function for merging signs into the following numbers and normalizing the operators of a list of tokens
+def _signed(tokens):
+    items, sign = [], 1.0
+    for token in tokens:
+        if token in ('+', '-'):
+            sign = -1.0 if token == '-' else 1.0
+        elif token in _OPERATORS:
+            items.append(_OPERATORS[token])
+        else:
+            value = _number(token)
+            items.append(token if value is None else sign * value)
+            sign = 1.0
+    return items
+
+# define a class for a linear program (read from a CPLEX LP file)
+class LinearProgram:
+
+    # create an instance of this class by reading an LP file
+    def __init__(self, path):
+        self.variables = {}
+        self.sense = 'min'
+        objective = {}
+        rows, row_senses, rhs = [], [], []
+        entries = {}
+        lower, upper = {}, {}
+        integers, binaries = set(), set()
+
+        # split the file into sections (comments start with a backslash)
+        sections = []
+        with open(path) as fh:
+            for line in fh:
+                line = line.split('\\', 1)[0].strip()
+                if not line:
+                    continue
+                section = _SECTIONS.get(line.lower().rstrip(':'))
+                if section is not None:
+                    sections.append((section, []))
+                elif sections:
+                    sections[-1][1].append(line)
+
+        for section, lines in sections:
+            tokens = _TOKEN.findall(' '.join(lines))
+
+            # objective: an optional label followed by a linear expression
+            if section in ('min', 'max'):
+                self.sense = section
+                if len(tokens) > 1 and tokens[1] == ':':
+                    tokens = tokens[2:]
+                self._expression(tokens, objective)
+
+            # constraints: an optional label, a linear expression, a sense and a right-hand side
+            elif section == 'st':
+                i = 0
+                while i < len(tokens):
+                    j = i
+                    while j < len(tokens) and tokens[j] not in _OPERATORS:
+                        j += 1
+                    k = j + 2 if j + 1 < len(tokens) and tokens[j + 1] in '+-' else j + 1
+                    expression = tokens[i:j]
+                    if len(expression) > 1 and expression[1] == ':':
+                        expression = expression[2:]
+                    row = {}
+                    self._expression(expression, row)
+                    value = _number(tokens[k])
+                    rhs.append(-value if tokens[k - 1] == '-' else value)
+                    row_senses.append({'<=': 'L', '>=': 'G', '=': 'E'}[_OPERATORS[tokens[j]]])
+                    for variable, coefficient in row.items():
+                        entries[(len(rows), variable)] = coefficient
+                    rows.append(row)
+                    i = k + 1
+
+            # bounds: 'x free', 'x <= u', 'x >= l', 'x = v', 'l <= x' or 'l <= x <= u' (one per line)
+            elif section == 'bounds':
+                for line in lines:
+                    items = _signed(_TOKEN.findall(line))
+                    if len(items) == 2 and str(items[1]).lower() == 'free':
+                        self._variable(items[0])
+                        lower[items[0]], upper[items[0]] = -np.inf, np.inf
+                        continue
+
+                    # write every bound as (variable, operator, value)
+                    if isinstance(items[0], str):
+                        bounds = [(items[0], items[1], items[2])]
+                    else:
+                        bounds = [(items[2], _MIRRORED[items[1]], items[0])] + ([(items[2], items[3], items[4])] if len(items) == 5 else [])
+                    for variable, operator, value in bounds:
+                        self._variable(variable)
+                        if operator in ('>=', '='):
+                            lower[variable] = value
+                        if operator in ('<=', '='):
+                            upper[variable] = value
+
+            # integer and binary variables
+            elif section in ('int', 'bin'):
+                for variable in tokens:
+                    self._variable(variable)
+                    (integers if section == 'int' else binaries).add(variable)
+
+        # build the arrays (variables in order of appearance)
+        names = list(self.variables)
+        n = len(names)
+        self.names = names
+        self.c = np.array([objective.get(v, 0.0) for v in names])
+        self.row_senses = np.array(row_senses)
+        self.rhs = np.array(rhs, dtype = float)
+        keys = sorted(entries, key = lambda key: (key[0], self.variables[key[1]]))
+        self.a_rows = np.array([row for row, _ in keys], dtype = int)
+        self.a_columns = np.array([self.variables[variable] for _, variable in keys], dtype = int)
+        self.a_values = np.array([entries[key] for key in keys], dtype = float)
+        self.lower = np.array([0.0 if v in binaries else lower.get(v, 0.0) for v in names])
+        self.upper = np.array([1.0 if v in binaries else upper.get(v, np.inf) for v in names])
+        self.integrality = np.array([v in integers or v in binaries for v in names], dtype = int)
+        self.shape = (len(rows), n)
+
+    # define a function for registering a variable
+    def _variable(self, name):
+        if name not in self.variables:
+            self.variables[name] = len(self.variables)
+
+    # define a function for adding the terms of a linear expression to a dict
+    def _expression(self, tokens, terms):
+        sign, coefficient = 1.0, None
+        for token in tokens:
+            if token in '+-':
+                sign = sign * (-1.0 if token == '-' else 1.0)
+                continue
+            value = _number(token)
+            if value is not None:
+                coefficient = value
+                continue
+            self._variable(token)
+            terms[token] = terms.get(token, 0.0) + sign * (1.0 if coefficient is None else coefficient)
+            sign, coefficient = 1.0, None
+
+    # define a function for the structure of the program (programs with the same structure differ only in their values)
+    def structure(self):
+        return (tuple(self.names), self.sense, self.row_senses.tobytes(), self.a_rows.tobytes(),
+                self.a_columns.tobytes(), self.integrality.tobytes())
+
+    # define a function for all values of the program as one vector (objective, coefficients, right-hand sides, bounds)
+    def values(self):
+        return np.concatenate([self.c, self.a_values, self.rhs, self.lower, self.upper])
+
+    # define a function for solving the program with given values (HiGHS), returns the values of the variables or None
+    def solve(self, values = None):
+        values = self.values() if values is None else values
+        n, nnz, m = len(self.names), len(self.a_values), len(self.rhs)
+        c = values[:n]
+        a_values = values[n:n + nnz]
+        rhs = values[n + nnz:n + nnz + m]
+        lower = values[n + nnz + m:2 * n + nnz + m]
+        upper = values[2 * n + nnz + m:]
+
+        constraints = []
+        if m:
+            A = csr_matrix((a_values, (self.a_rows, self.a_columns)), shape = self.shape)
+            constraints = [LinearConstraint(A, np.where(self.row_senses == 'L', -np.inf, rhs), np.where(self.row_senses == 'G', np.inf, rhs))]
+        try:
+            result = milp(c if self.sense == 'min' else -c, constraints = constraints,
+                          integrality = self.integrality, bounds = Bounds(lower, upper))
+        except ValueError:
+            return None
+        return result.x if result.success else None
+
+# define a class for a learned mapping of a model file and policy: the LP, the patches and the output variables
+class _Template:
+
+    def __init__(self, program, base_experiment, patches, outputs):
+        self.program = program
+        self.values = program.values()
+        self.base = {column: np.asarray(values, dtype = float) for column, values in base_experiment.items()}
+        self.patches = patches
+        self.outputs = outputs
+        self.n_solved = 0
+        self.enabled = True
+
+        # whether a cross-check has confirmed the template (until then every solve is cross-checked)
+        self.verified = False
+
+    # define a function for the values of the LP for an experiment (None if the experiment does not fit the template)
+    def patched_values(self, experiment):
+        values = self.values.copy()
+        for column, (entries, cells, coefficients) in self.patches.items():
+            new = _cells(experiment.get(column))
+            if new is None or len(new) != len(self.base[column]):
+                return None
+            np.add.at(values, entries, coefficients * (new[cells] - self.base[column][cells]))
+        return values
+
+# define a function for the numeric cells of an experiment column (None if it is not numeric)
+def _cells(value):
+    values = value if isinstance(value, list) else [value]
+    if not values or not all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in values):
+        return None
+    return np.asarray(values, dtype = float)
+
+# define a function for choosing the LP variable of every row of an output variable from the variables with the same values
+# (values that are equal in all runs, e.g. zeros, are resolved by the names: one name prefix with an index linear in the row)
+def _match_names(variables, candidates):
+    if not all(candidates):
+        return None
+    split = [re.match(r'(.*?)(\d*)$', name).groups() for name in variables]
+
+    # the prefix shared by a candidate of every row
+    prefixes = set.intersection(*[{split[j][0] for j in row} for row in candidates])
+    if not prefixes:
+        return None
+    for prefix in sorted(prefixes):
+        rows = [[j for j in row if split[j][0] == prefix] for row in candidates]
+
+        # fit the index of the name (offset + stride * row) to the rows with a single candidate
+        unique = [(r, int(split[row[0]][1])) for r, row in enumerate(rows) if len(row) == 1 and split[row[0]][1]]
+        if len(unique) >= 2:
+            strides = [(s2 - s1) // (r2 - r1) for (r1, s1), (r2, s2) in zip(unique, unique[1:]) if (s2 - s1) % (r2 - r1) == 0]
+            stride = max(set(strides), key = strides.count) if strides else 0
+        else:
+            stride = 1
+        offsets = [s - stride * r for r, s in unique] or [int(split[rows[0][0]][1] or 0)]
+        offset = max(set(offsets), key = offsets.count)
+
+        # pick the candidate with the expected name, or the only candidate
+        indices = []
+        for r, row in enumerate(rows):
+            expected = variables.get(f'{prefix}{offset + stride * r}')
+            if expected in row:
+                indices.append(expected)
+            elif len(row) == 1:
+                indices.append(row[0])
+            else:
+                break
+        else:
+            return np.array(indices)
+    return None
+
+# define a class for the LP reuse mode of the Linny-R connector (set as the lp_reuse attribute of a model)
+class LPReuse:
+
+    # create an instance of this class
+    #   directory: optional folder in which the learned mappings are kept (shared by processes and campaigns)
+    #   check_every: cross-check every n-th solve of a model against a normal Linny-R run (the first one is always checked)
+    #   probe_size: relative size of the perturbation of the input cells in the probes
+    #   rtol: relative tolerance for learning and for the cross-checks
+    #   decimals: number of decimals to which solution and output values are matched
+    #   max_probes: maximum number of probe runs of Linny-R for learning a model and policy (2 if all columns can be probed at once,
+    #               2 per numeric input column otherwise)
+    def __init__(self, directory = None, check_every = 50, probe_size = 0.1, rtol = 1e-4, decimals = 4, seed = 0, max_probes = 10):
+        if milp is None:
+            raise ImportError('the LP reuse mode needs scipy (1.9 or newer) for the HiGHS solver')
+        self.directory = directory
+        self.check_every = check_every
+        self.probe_size = probe_size
+        self.rtol = rtol
+        self.decimals = decimals
+        self.seed = seed
+        self.max_probes = max_probes
+        if directory is not None:
+            os.makedirs(directory, exist_ok = True)
+
+        # the learned templates per key (None if the model cannot reuse its LP) and a lock per key
+        self._templates = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+        # the hashes of the model files by path, size and modification time
+        self._model_hashes = {}
+
+        # count the runs
+        self.n_reused = 0
+        self.n_checked = 0
+
+    # share the templates between the copies of a model (e.g. one per thread of the thread pool evaluator)
+    def __deepcopy__(self, memo):
+        return self
+
+    # and leave the locks out when pickled to a worker process
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_templates'] = {key: template for key, template in self._templates.items()
+                               if template is None or template.enabled}
+        del state['_locks'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    # define a function for running Linny-R on an experiment in a scratch directory while learning, returns (LP or None, outputs or None)
+    # (a run that times out or cannot be started raises, so learning stops instead of mistaking it for a nonlinear model)
+    def _linnyr(self, model, experiment, model_file):
+        modelfile = model_file[:-4]
+        scratch = model._create_scratch(model_file)
+        try:
+            model._write_experiment(experiment, os.path.join(scratch, model.experiment_file))
+            exit_code, _ = model._run_solver([model.linnyr, modelfile, model.experiment_file], scratch)
+            lp_path = os.path.join(scratch, f'{modelfile}_exp.lp')
+            try:
+                program = LinearProgram(lp_path) if os.path.isfile(lp_path) else None
+            except (ValueError, TypeError, KeyError, IndexError):
+                _logger.info(f'LP of {model.name} ({model_file}) cannot be reused: the LP file cannot be read')
+                program = None
+            try:
+                outputs = model._read_results(os.path.join(scratch, f'{modelfile}_exp.csv')) if exit_code == 0 else None
+            except (OSError, ValueError, StopIteration):
+                outputs = None
+
+            # remember the shapes of the output variables, so a failed run of the connector can be filled with NaN
+            if outputs is not None:
+                model._output_shapes.update({variable: np.shape(values) for variable, values in outputs.items()})
+            return program, outputs
+        finally:
+            shutil.rmtree(scratch, ignore_errors = True)
+
+    # define a function for the key of a model file and policy (and the file name of its kept mapping)
+    def _key(self, model, experiment, model_file):
+        layout = tuple((column, isinstance(value, list)) for column, value in experiment.items())
+        path = os.path.join(model.working_directory, model_file)
+        stat = os.stat(path)
+        model_hash = self._model_hashes.get((path, stat.st_size, stat.st_mtime_ns))
+        if model_hash is None:
+            model_hash = file_hash(path)
+            self._model_hashes[(path, stat.st_size, stat.st_mtime_ns)] = model_hash
+        policy = getattr(getattr(model, 'policy', None), 'name', None)
+        return hashlib.sha256(repr((model_hash, layout, policy, sorted(model._required_columns() or []))).encode()).hexdigest()
+
+    # define a function for learning which LP entries depend on which input cells for a group of columns
+    def _learn_group(self, model, experiment, model_file, program, columns):
+        rng = np.random.default_rng(self.seed)
+        n_cells = sum(len(_cells(experiment[column])) for column in columns)
+
+        # two probes: the perturbation of the g-th cell in the second probe is (1 + (g + 1) / (n + 1)) times that in the first
+        ratios = 1 + np.arange(1, n_cells + 1) / (n_cells + 1)
+        deltas = {}
+        probes = [dict(experiment), dict(experiment)]
+        offset = 0
+        for column in columns:
+            base = _cells(experiment[column])
+            delta = self.probe_size * rng.uniform(0.5, 1.0, len(base)) * np.where(base != 0, np.abs(base), 1.0)
+            deltas[column] = (offset, delta)
+            for probe, factor in zip(probes, [np.ones(len(base)), ratios[offset:offset + len(base)]]):
+                values = (base + factor * delta).tolist()
+                probe[column] = values if isinstance(experiment[column], list) else values[0]
+            offset += len(base)
+
+        runs = [self._linnyr(model, probe, model_file) for probe in probes]
+        if any(p is None or p.structure() != program.structure() for p, _ in runs):
+            return None
+
+        # find the changed entries and identify the cell and coefficient of each of them
+        base_values = program.values()
+        with np.errstate(invalid = 'ignore'):
+            d1, d2 = [np.nan_to_num(p.values() - base_values, nan = 0.0, posinf = 0.0, neginf = 0.0) for p, _ in runs]
+        scale = np.maximum(np.abs(np.nan_to_num(base_values, posinf = 0.0, neginf = 0.0)), 1.0)
+        changed = np.flatnonzero((np.abs(d1) > self.rtol * scale) | (np.abs(d2) > self.rtol * scale))
+        if len(changed) and np.any(np.abs(d1[changed]) <= self.rtol * scale[changed]):
+            return None
+        cells = np.rint((d2[changed] / d1[changed] - 1) * (n_cells + 1) - 1).astype(int) if len(changed) else np.array([], dtype = int)
+        if np.any((cells < 0) | (cells >= n_cells)):
+            return None
+
+        patches = {}
+        for column in columns:
+            offset, delta = deltas[column]
+            in_column = (cells >= offset) & (cells < offset + len(delta))
+            entries, column_cells = changed[in_column], cells[in_column] - offset
+            coefficients = d1[entries] / delta[column_cells]
+
+            # the second probe must be explained by the same cell and coefficient
+            predicted = coefficients * delta[column_cells] * ratios[offset + column_cells]
+            if not np.allclose(predicted, d2[entries], rtol = self.rtol, atol = self.rtol * scale[entries].max(initial = 1.0)):
+                return None
+            if len(entries):
+                patches[column] = (entries, column_cells, coefficients)
+
+        return patches, runs
+
+    # define a function for learning the template of a model file and policy from the LP and outputs of an experiment (None if its LP cannot be reused)
+    def _learn(self, model, experiment, model_file, program, outputs):
+        columns = [column for column, value in experiment.items() if _cells(value) is not None]
+
+        # probe all columns at once, or every column separately if that is ambiguous (within the budget of probe runs)
+        learned = self._learn_group(model, experiment, model_file, program, columns)
+        if learned is None:
+            if 2 + 2 * len(columns) > self.max_probes:
+                _logger.info(f'LP of {model.name} ({model_file}) is not reused: probing its {len(columns)} input columns separately exceeds {self.max_probes} probe runs')
+                return None
+            patches, runs = {}, []
+            for column in columns:
+                learned = self._learn_group(model, experiment, model_file, program, [column])
+                if learned is None:
+                    _logger.info(f'LP of {model.name} ({model_file}) cannot be reused: column {column} does not enter it linearly')
+                    return None
+                patches.update(learned[0])
+                runs += learned[1]
+        else:
+            patches, runs = learned
+
+        # match the output values with the solution values of these runs
+        samples = [(program, outputs)] + runs
+        solutions = [p.solve() for p, _ in samples]
+        if any(solution is None or outputs is None for solution, (_, outputs) in zip(solutions, samples)):
+            return None
+        X = np.round(np.array(solutions), self.decimals) + 0.0
+        lookup = {}
+        for j in range(X.shape[1]):
+            lookup.setdefault(X[:, j].tobytes(), []).append(j)
+        matched = {}
+        for variable in outputs:
+            Y = np.round(np.array([np.atleast_1d(o[variable]).astype(float) for _, o in samples]), self.decimals) + 0.0
+            indices = _match_names(program.variables, [lookup.get(Y[:, r].tobytes(), []) for r in range(Y.shape[1])])
+            if indices is None:
+                _logger.info(f'LP of {model.name} ({model_file}) cannot be reused: output variable {variable} is not a variable of the LP')
+                return None
+            matched[variable] = indices
+
+        base = {column: _cells(experiment[column]) for column in columns}
+        return _Template(program, base, patches, matched)
+
+    # define a function for the template of a model file and policy (learned once, shared by threads, optionally kept on disk),
+    # returns (template or None, outputs of the Linny-R run of this experiment if it was used for learning, otherwise None)
+    def _template(self, model, experiment, model_file):
+        key = self._key(model, experiment, model_file)
+        if key in self._templates:
+            return self._templates[key], None
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        # while one thread learns the template, the experiments of the other threads are run by Linny-R
+        if not lock.acquire(blocking = False):
+            return None, None
+        try:
+            if key in self._templates:
+                return self._templates[key], None
+            path = os.path.join(self.directory, f'{key}.pkl') if self.directory is not None else None
+            if path is not None and os.path.isfile(path):
+                with open(path, 'rb') as fh:
+                    self._templates[key] = pickle.load(fh)
+                return self._templates[key], None
+
+            # learn from the Linny-R run of this experiment and its probes
+            # (a learning run that hangs or cannot be started leaves the model to Linny-R for this campaign, not kept on disk)
+            outputs = None
+            try:
+                program, outputs = self._linnyr(model, experiment, model_file)
+                template = None if program is None or outputs is None else self._learn(model, experiment, model_file, program, outputs)
+            except (subprocess.TimeoutExpired, OSError, ValueError) as e:
+                _logger.warning(f'LP of {model.name} ({model_file}) is not reused: learning failed ({type(e).__name__}: {e})')
+                self._templates[key] = None
+                return None, outputs
+            if path is not None:
+                fd, tmp = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+                with os.fdopen(fd, 'wb') as fh:
+                    pickle.dump(template, fh)
+                os.replace(tmp, path)
+            self._templates[key] = template
+            return template, outputs
+        finally:
+            lock.release()
+
+    # define a function for the results of an experiment without a Linny-R run of the connector, returns (results or None if it must
+    # be run by Linny-R, mode): 'learned' for the outputs of the Linny-R run that the template was learned from, 'reused' for the
+    # solution of the patched LP, or 'check' if that solution must be cross-checked with a normal (supervised) Linny-R run of the
+    # connector, which passes its results to cross_check (the solves until a cross-check succeeded and every check_every-th one)
+    def run(self, model, experiment, model_file):
+        template, outputs = self._template(model, experiment, model_file)
+        if outputs is not None:
+            return outputs, 'learned'
+        if template is None or not template.enabled:
+            return None, None
+        values = template.patched_values(experiment)
+        solution = None if values is None else template.program.solve(values)
+        if solution is None:
+            return None, None
+        results = {variable: solution[indices].astype(model.output_dtype) for variable, indices in template.outputs.items()}
+
+        template.n_solved += 1
+        if not getattr(template, 'verified', False) or (template.n_solved - 1) % self.check_every == 0:
+            return results, 'check'
+        self.n_reused += 1
+        return results, 'reused'
+
+    # define a function for comparing the results of the patched LP with those of Linny-R (switches the reuse off if they differ)
+    def cross_check(self, model, experiment, model_file, results, reference):
+        self.n_checked += 1
+        template = self._templates.get(self._key(model, experiment, model_file))
+        for variable, values in results.items():
+            expected = np.asarray(reference[variable], dtype = float)
+            if not np.allclose(values, expected, rtol = self.rtol, atol = self.rtol * max(1.0, np.abs(expected).max(initial = 0.0))):
+                if template is not None:
+                    template.enabled = False
+                _logger.warning(f'LP reuse of {model.name} ({model_file}) switched off: {variable} differs from Linny-R')
+                return False
+        if template is not None:
+            template.verified = True
+        return True
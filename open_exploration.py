@@ -10,10 +10,14 @@ from ema_workbench import (RealParameter,
                            ScalarOutcome,
                            ArrayOutcome,
                            Policy,
-                           MultiprocessingEvaluator,
                            save_results,
                            ema_logging)
-from linnyr_connector import LinnyRModel_Botlek
+from linnyr_connector import LinnyRModel_Botlek, LinnyRModel_Botlek_Batch
+from thread_evaluator import ThreadPoolEvaluator
+from result_store import StreamingCallback, ResumableMultiprocessingEvaluator
+from adaptive_sampling import AdaptiveExploration
+from lp_reuse import LPReuse
+from functools import partial
 import numpy as np
 
 # for EMA Workbench
@@ -22,15 +26,27 @@ if __name__ == '__main__':
     # enable info logging
     ema_logging.log_to_stderr(ema_logging.INFO)
 
+    # solve the ten weeks of a perspective in one experiment (one result row per scenario and policy per perspective)
+    batch = False
+
     # define a list with the models for the different perspectives and weeks
     model_list = []
     for perspective in ['collective', 'airliquide', 'nouryon', 'huntsman']:
-        for week in range(1,11):
-            model = LinnyRModel_Botlek(name = f'{perspective}week{week}', 
-                                       wd = './models', 
-                                       model_file = f'botlek_model_{perspective}_week_{week}.lnr')
+        if batch:
+            model = LinnyRModel_Botlek_Batch(name = f'{perspective}', 
+                                             wd = './models', 
+                                             model_files = [f'botlek_model_{perspective}_week_{week}.lnr' for week in range(1,11)])
             model_list.append(model)
+        else:
+            for week in range(1,11):
+                model = LinnyRModel_Botlek(name = f'{perspective}week{week}', 
+                                           wd = './models', 
+                                           model_file = f'botlek_model_{perspective}_week_{week}.lnr')
+                model_list.append(model)
                         
+    # define the period that the summed outcomes cover (a batch experiment covers all ten weeks)
+    period = 'ten weeks' if batch else 'week'
+
     # for every model in the model list
     for model in model_list:
 
@@ -93,31 +109,46 @@ if __name__ == '__main__':
                                          variable_name = 'chlorine_storage')]
 
         # define the outcomes
-        model.outcomes = [ScalarOutcome(name = 'Total cash flow of the cluster (euro/week)',
+        model.outcomes = [ScalarOutcome(name = f'Total cash flow of the cluster (euro/{period})',
                                        variable_name = 'CF total',
                                        function = np.sum),
-                          ScalarOutcome(name = 'Total cash flow of Air Liquide (euro/week)',
+                          ScalarOutcome(name = f'Total cash flow of Air Liquide (euro/{period})',
                                        variable_name = 'CF Air Liquide',
                                        function = np.sum),
-                          ScalarOutcome(name = 'Total cash flow of Huntsman (euro/week)',
+                          ScalarOutcome(name = f'Total cash flow of Huntsman (euro/{period})',
                                        variable_name = 'CF Huntsman',
                                        function = np.sum),
-                          ScalarOutcome(name = 'Total cash flow of Nouryon (euro/week)',
+                          ScalarOutcome(name = f'Total cash flow of Nouryon (euro/{period})',
                                        variable_name = 'CF Nouryon',
                                        function = np.sum),
-                          ScalarOutcome(name = 'Total CO2 emissions (ton/week)',
+                          ScalarOutcome(name = f'Total CO2 emissions (ton/{period})',
                                        variable_name = 'CO2 emission',
                                        function = np.sum),
-                          ScalarOutcome(name = 'Total green steam use by Air Liquide and Huntsman (ton/week)',
+                          ScalarOutcome(name = f'Total green steam use by Air Liquide and Huntsman (ton/{period})',
                                        variable_name= 'Use SP-A',
                                        function = np.sum),
-                          ScalarOutcome(name = 'Total green steam use by Nouryon (ton/week)',
+                          ScalarOutcome(name = f'Total green steam use by Nouryon (ton/{period})',
                                        variable_name = 'Use SP-B',
                                        function = np.sum),
                           ArrayOutcome(name = 'Chlorine storage stock at Nouryon (ton)',
                                        variable_name = 'Chlorine storage'),
                           ArrayOutcome(name = 'Run-time (s)',
-                                       variable_name = 'Run-time')]
+                                       variable_name = 'Run-time'),
+                          ScalarOutcome(name = 'Failed run (-)',
+                                       variable_name = 'Failed')]
+
+        # in batch mode the outcomes above sum all ten weeks, so add the annual totals of the cash flows and emissions
+        if batch:
+            model.outcomes += [ScalarOutcome(name = 'Annual cash flow of the cluster (euro/year)',
+                                             variable_name = 'CF total annual'),
+                               ScalarOutcome(name = 'Annual cash flow of Air Liquide (euro/year)',
+                                             variable_name = 'CF Air Liquide annual'),
+                               ScalarOutcome(name = 'Annual cash flow of Huntsman (euro/year)',
+                                             variable_name = 'CF Huntsman annual'),
+                               ScalarOutcome(name = 'Annual cash flow of Nouryon (euro/year)',
+                                             variable_name = 'CF Nouryon annual'),
+                               ScalarOutcome(name = 'Annual CO2 emissions (ton/year)',
+                                             variable_name = 'CO2 emission annual')]
     
     # define the full factorial set of policies with names
     policies = [Policy('None of the options', **{'Steam Pipe':False, 'E-boiler':False, 'Chlorine Storage':False}),
@@ -132,10 +163,57 @@ if __name__ == '__main__':
     # define the number of scenarios to be sampled
     scenarios = 100
 
+    # seed the sampling, so an interrupted run can be resumed with the same experiments
+    np.random.seed(2020)
+
+    # stream every finished experiment to this folder and skip the experiments already in it (set resume after a crash)
+    results_directory = f'./results/open_exploration_{scenarios}_scenarios'
+    resume = False
+    callback = partial(StreamingCallback, directory = results_directory, resume = resume)
+
+    # pick the scenarios adaptively with surrogates of the outcomes instead of a fixed sample (up to the number of scenarios above)
+    # (the batches are not streamed to the results folder, so an interrupted adaptive run cannot be resumed)
+    adaptive = False
+
+    # define the evaluator: 'threads' drives all Linny-R runs from this process, 'processes' uses one Python process per slot
+    evaluator_type = 'threads'
+
+    # define the number of concurrent runs and the maximum run-time of a single run in seconds (None for no limit)
+    n_parallel = 56
+    timeout = None
+
+    # solve patched copies of the LP that Linny-R generated for every model and policy with HiGHS (needs scipy), cross-checked with Linny-R
+    lp_reuse = False
+    if lp_reuse:
+        shared_lp_reuse = LPReuse(directory = './results/lp_reuse', check_every = 50)
+        for model in model_list:
+            model.lp_reuse = shared_lp_reuse
+
+    # a batch experiment solves its weeks in parallel, so divide the concurrent runs over them (keeps the number of Linny-R processes at n_parallel)
+    if batch:
+        n_parallel = max(1, n_parallel // model_list[0].n_parallel_weeks)
+
     # run the models
-    with MultiprocessingEvaluator(model_list, n_processes = 56) as evaluator:
-         results = evaluator.perform_experiments(policies = policies, scenarios = scenarios)
+    if evaluator_type == 'threads':
+        evaluator = ThreadPoolEvaluator(model_list, n_threads = n_parallel, timeout = timeout)
+    else:
+        for model in model_list:
+            model.timeout = timeout
+        evaluator = ResumableMultiprocessingEvaluator(model_list, n_processes = n_parallel)
+    with evaluator:
+        if adaptive:
+            # fit the surrogates to the scalar outcomes, but not to the failed run flag (failed runs have NaN outcomes and are left out)
+            outcomes = [outcome.name for outcome in model_list[0].outcomes
+                        if isinstance(outcome, ScalarOutcome) and outcome.name != 'Failed run (-)']
+            exploration = AdaptiveExploration(evaluator, policies, outcomes = outcomes, n_initial = 20, batch_size = 10,
+                                              max_scenarios = scenarios, criterion = 'ranking', tolerance = 0.01, seed = 2020)
+            results = exploration.run()
+        else:
+            results = evaluator.perform_experiments(policies = policies, scenarios = scenarios, callback = callback)
     
     # save the results
-    save_results(results, f'./results/results_open_exploration_{scenarios}_scenarios_improved_model.tar.gz')
+    if adaptive:
+        save_results(results, f'./results/results_open_exploration_adaptive_{exploration.n_scenarios}_scenarios_improved_model.tar.gz')
+    else:
+        save_results(results, f'./results/results_open_exploration_{scenarios}_scenarios_improved_model.tar.gz')
 
@@ -0,0 +1,75 @@
+'''
+Shared, load-once store for the reference data of the Linny-R models
+
+Every column of a csv file that a model needs is read once per process into a
+compact, read-only float64 NumPy array (other columns, e.g. timestamps, are
+not read). Optionally the columns are cached as .npy files and memory-mapped,
+so forked or spawned workers share the same pages instead of holding their
+own copies. Models only keep a reference to these arrays and
+fetch them again from the store after being unpickled in a worker.
+
+'''
+
+# import required packages
+import os
+import numpy as np
+import pandas as pd
+
+# module level store with the loaded reference data, keyed by the absolute path of the csv file
+_store = {}
+
+# define a function for loading a single column from the .npy cache (None if the cache is missing or outdated)
+def _load_cached_column(csv_path, cache_path):
+    if os.path.isfile(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path):
+        return np.load(cache_path, mmap_mode = 'r')
+    return None
+
+# define a function for getting columns of a reference data csv file as read-only float64 arrays (all columns if columns is None)
+def get_reference_data(file_name, data_directory = './data', cache_directory = None, columns = None):
+
+    # locate the csv file
+    csv_path = os.path.abspath(os.path.join(data_directory, file_name))
+
+    # the columns of this file that are already loaded
+    data = _store.setdefault(csv_path, {})
+
+    # read the header only to find the columns (if not given)
+    if columns is None:
+        columns = list(pd.read_csv(csv_path, nrows = 0).columns)
+    missing = [column for column in columns if column not in data]
+
+    if missing:
+
+        # try to memory-map every missing column from the cache
+        loaded = {}
+        if cache_directory is not None:
+            for column in missing:
+                cache_path = os.path.join(cache_directory, f'{os.path.splitext(file_name)[0]}.{column}.npy')
+                array = _load_cached_column(csv_path, cache_path)
+                if array is None:
+                    loaded = {}
+                    break
+                loaded[column] = array
+
+        # otherwise read only these columns of the csv file into float64 arrays (and fill the cache)
+        if not loaded:
+            frame = pd.read_csv(csv_path, usecols = missing)
+            for column in missing:
+                array = np.ascontiguousarray(frame[column], dtype = np.float64)
+                if cache_directory is not None:
+                    os.makedirs(cache_directory, exist_ok = True)
+                    cache_path = os.path.join(cache_directory, f'{os.path.splitext(file_name)[0]}.{column}.npy')
+                    np.save(cache_path, array)
+                    array = np.load(cache_path, mmap_mode = 'r')
+                loaded[column] = array
+
+        # make sure the shared arrays cannot be modified by any model
+        for array in loaded.values():
+            array.flags.writeable = False
+        data.update(loaded)
+
+    return {column: data[column] for column in columns}
+
+# define a function for emptying the store (e.g. after the reference data files have changed)
+def clear_reference_data():
+    _store.clear()
@@ -0,0 +1,134 @@
+'''
+Persistent, content-addressed cache for the results of Linny-R runs
+
+A run is identified by a hash of the model file, the experiment input file and
+the solver binary. The parsed results are stored as compressed .npz files, and
+the least recently used entries are evicted once the cache exceeds its maximum
+size. Writes are atomic, so several worker processes can share one cache.
+The size of the cache is tracked with a running total, and the folder is only
+scanned when that total exceeds the maximum or after every rescan_every writes
+(to account for entries written by other processes).
+
+'''
+
+# import required packages
+import hashlib, os, tempfile
+import numpy as np
+
+# define a function for hashing the contents of a file
+def file_hash(path, chunk_size = 1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+# define a class for the on-disk result cache
+class ResultCache:
+
+    # create an instance of this class (maximum size in bytes, 2 GB by default)
+    def __init__(self, directory, max_size = 2 * 1024**3, rescan_every = 1000):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self.rescan_every = rescan_every
+
+        # running total of the size of the cache (None until the folder is scanned) and the writes since the last scan
+        self._size = None
+        self._puts_since_scan = 0
+
+        # remember the hashes of files that rarely change (model file, solver) by path, size and modification time
+        self._hashes = {}
+
+        os.makedirs(self.directory, exist_ok = True)
+
+    # define a function for hashing a file that is expected to stay the same between runs
+    def _static_file_hash(self, path):
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._hashes:
+            self._hashes[memo_key] = file_hash(path)
+        return self._hashes[memo_key]
+
+    # define a function for the key of a run
+    def key(self, model_path, experiment_path, solver_path):
+        h = hashlib.sha256()
+        h.update(self._static_file_hash(model_path).encode())
+        h.update(file_hash(experiment_path).encode())
+        h.update(self._static_file_hash(solver_path).encode())
+        return h.hexdigest()
+
+    # define a function for the location of an entry
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    # define a function for getting the cached results of a run (None if not cached)
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                results = {name: data[name] for name in data.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return results
+
+    # define a function for storing the results of a run
+    def put(self, key, results):
+
+        # write to a temporary file first and move it into place, so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                np.savez_compressed(fh, **{name: np.asarray(value) for name, value in results.items()})
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # only scan the folder when the running total exceeds the maximum size (or now and then for other processes' entries)
+        self._puts_since_scan += 1
+        if self._size is None or self._puts_since_scan >= self.rescan_every:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_size:
+                self.evict()
+
+    # define a function for removing the least recently used entries until the cache fits 90% of its maximum size
+    # (the margin keeps the next scan of the folder away until a tenth of the cache has been written again)
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+        self._size = total_size
+        self._puts_since_scan = 0
+
+    # define a function for emptying the cache
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                os.remove(entry.path)
+        self._size = 0
@@ -0,0 +1,199 @@
+'''
+Streaming, crash-safe result store for long experiment campaigns
+
+Instead of keeping all results in memory until the last experiment has
+finished, StreamingCallback appends the finished experiments to compressed .npz
+shards in a results directory (one shard per shard_size experiments). With
+resume=True the experiments that are already in the store are skipped by the
+evaluator, so an interrupted campaign continues where it stopped. This
+requires the same design of experiments, so seed the sampling (np.random.seed)
+before calling perform_experiments.
+
+Use it via functools.partial, since the workbench creates the callback itself:
+
+    callback = functools.partial(StreamingCallback, directory = './results/run', resume = True)
+    evaluator.perform_experiments(..., callback = callback)
+
+'''
+
+# import required packages
+import glob, os, tempfile
+import numpy as np
+import pandas as pd
+from ema_workbench.em_framework.callbacks import AbstractCallback
+from ema_workbench.em_framework.futures_multiprocessing import MultiprocessingEvaluator, add_tasks
+from ema_workbench.em_framework.parameters import BooleanParameter, CategoricalParameter, IntegerParameter
+from ema_workbench.em_framework.points import experiment_generator
+from ema_workbench.em_framework.util import ProgressTrackingMixIn
+from ema_workbench.util import EMAError, get_module_logger
+
+_logger = get_module_logger(__name__)
+
+# define a function for listing the shards in a results directory
+def shard_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, 'shard_*.npz')))
+
+# define a function for reading all shards in a results directory
+def read_shards(directory):
+    shards = []
+    for path in shard_paths(directory):
+        with np.load(path) as data:
+            shards.append({key: data[key] for key in data.files})
+    return shards
+
+# define a function for skipping the experiments that are already completed (used by the evaluators)
+def remaining_experiments(experiments, callback):
+    completed = getattr(callback, 'completed', {})
+    for experiment in experiments:
+        if experiment.experiment_id in completed:
+
+            # make sure the stored experiment is the same experiment (same sample, policy and model)
+            if callback._identity(completed[experiment.experiment_id]) != callback._identity(callback._case(experiment)):
+                raise EMAError(f'experiment {experiment.experiment_id} differs from the stored results, '
+                               'use the same seed and settings to resume')
+            continue
+        yield experiment
+
+# define a callback that streams the results to shards on disk
+class StreamingCallback(AbstractCallback):
+
+    def __init__(self, uncertainties, levers, outcomes, nr_experiments,
+                 reporting_interval=None, reporting_frequency=10, log_progress=False,
+                 directory=None, shard_size=100, resume=False):
+        super().__init__(uncertainties, levers, outcomes, nr_experiments,
+                         reporting_interval, reporting_frequency, log_progress)
+
+        self.directory = os.path.abspath(directory)
+        self.shard_size = shard_size
+        self.uncertainties = [u.name for u in uncertainties]
+        self.levers = [l.name for l in levers]
+
+        # define the columns of the experiments dataframe with their dtype (as in the default callback)
+        self.dtypes = []
+        for parameter in self.parameters:
+            dtype = 'float'
+            if isinstance(parameter, BooleanParameter):
+                dtype = 'bool'
+            elif isinstance(parameter, CategoricalParameter):
+                dtype = 'object'
+            elif isinstance(parameter, IntegerParameter):
+                dtype = 'int'
+            self.dtypes.append((parameter.name, dtype))
+        self.dtypes.extend([('scenario', 'object'), ('policy', 'object'), ('model', 'object')])
+
+        # create an empty buffer for the experiments that are not yet written
+        self._buffer = []
+
+        os.makedirs(self.directory, exist_ok = True)
+        existing = read_shards(self.directory)
+        if existing and not resume:
+            raise EMAError(f'{self.directory} already contains results, resume or use another directory')
+
+        # remember the experiments that are already in the store
+        self.completed = {}
+        for shard in existing:
+            cases = zip(*[shard[f'c{j}'].tolist() for j in range(len(self.dtypes))])
+            for experiment_id, case in zip(shard['experiment_id'].tolist(), cases):
+                self.completed[experiment_id] = tuple(case)
+
+        # number the new shards after the existing ones
+        paths = shard_paths(self.directory)
+        self._next_shard = int(os.path.basename(paths[-1])[6:-4]) + 1 if paths else 0
+
+        # count them as done
+        if self.completed:
+            _logger.info(f'resuming: {len(self.completed)} experiments found in {self.directory}')
+            ProgressTrackingMixIn.__call__(self, len(self.completed))
+
+    # define a function for the row of an experiment in the experiments dataframe
+    def _case(self, experiment):
+        scenario = experiment.scenario
+        policy = experiment.policy
+        return (tuple([scenario[u] for u in self.uncertainties])
+                + tuple([policy[l] for l in self.levers])
+                + (str(scenario.name), str(policy.name), str(experiment.model_name)))
+
+    # define a function for the identity of an experiment: its row without the scenario name
+    # (the workbench numbers the scenarios with a counter that keeps running within a process)
+    def _identity(self, case):
+        scenario = len(self.dtypes) - 3
+        return case[:scenario] + case[scenario + 1:]
+
+    def __call__(self, experiment, outcomes):
+        super().__call__(experiment, outcomes)
+
+        # keep only the declared outcomes
+        outcomes = {o.name: outcomes[o.name] for o in self.outcomes if o.name in outcomes}
+        self._buffer.append((experiment.experiment_id, self._case(experiment), outcomes))
+
+        if len(self._buffer) >= self.shard_size:
+            self.flush()
+
+    # define a function for writing the buffered experiments to a new shard
+    def flush(self):
+        if not self._buffer:
+            return
+
+        shard = {'experiment_id': np.array([experiment_id for experiment_id, _, _ in self._buffer], dtype = np.int64)}
+
+        # store the columns of the experiments
+        for j, (name, dtype) in enumerate(self.dtypes):
+            column = [case[j] for _, case, _ in self._buffer]
+            shard[f'c{j}'] = np.array(column, dtype = str if dtype == 'object' else dtype)
+
+        # store every outcome with missing values for failed experiments
+        for k, outcome in enumerate(self.outcomes):
+            values = [outcomes.get(outcome.name) for _, _, outcomes in self._buffer]
+            present = [np.asarray(v, dtype = float) for v in values if v is not None]
+            if not present:
+                continue
+            shape = present[0].shape
+            data = np.full((len(values),) + shape, np.nan)
+            for i, value in enumerate(values):
+                if value is not None:
+                    data[i] = value
+            shard[f'o{k}'] = data
+
+        # write to a temporary file first and move it into place, so a crash never leaves a partial shard
+        fd, tmp_path = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            np.savez_compressed(fh, **shard)
+        os.replace(tmp_path, os.path.join(self.directory, f'shard_{self._next_shard:06d}.npz'))
+
+        self._next_shard += 1
+        self._buffer = []
+
+    def get_results(self):
+
+        # write the last experiments
+        self.flush()
+
+        # assemble the experiments dataframe and the outcome arrays from all shards
+        columns = {name: np.empty(self.nr_experiments, dtype = object) for name, _ in self.dtypes}
+        results = {}
+        for shard in read_shards(self.directory):
+            index = shard['experiment_id']
+            for j, (name, _) in enumerate(self.dtypes):
+                columns[name][index] = shard[f'c{j}']
+            for k, outcome in enumerate(self.outcomes):
+                if f'o{k}' not in shard:
+                    continue
+                data = shard[f'o{k}']
+                if outcome.name not in results:
+                    results[outcome.name] = np.full((self.nr_experiments,) + data.shape[1:], np.nan)
+                results[outcome.name][index] = data
+
+        experiments = pd.DataFrame(columns)
+        for name, dtype in self.dtypes:
+            try:
+                experiments[name] = experiments[name].astype(dtype)
+            except (ValueError, TypeError):
+                pass
+        return experiments, results
+
+# define a multiprocessing evaluator that skips the experiments already in a streaming store
+class ResumableMultiprocessingEvaluator(MultiprocessingEvaluator):
+
+    def evaluate_experiments(self, scenarios, policies, callback, combine = 'factorial'):
+        ex_gen = experiment_generator(scenarios, self._msis, policies, combine = combine)
+        add_tasks(self.n_processes, self._pool, remaining_experiments(ex_gen, callback), callback)
@@ -0,0 +1,84 @@
+'''
+Per-phase timing and solver metrics for the Linny-R connector
+
+A RunMetrics object collects one record per solver run: the wall-clock time of
+every phase (series generation, csv write, cache lookup, solve, output parse,
+cleanup), the number of attempts, the exit code and peak memory of the solver
+process, the process id and peak memory of the (worker) process that ran it
+and, if the run failed, the reason and the last lines of the Linny-R log file.
+Records can be appended to a JSONL trace file that is shared by threads and
+processes.
+
+'''
+
+# import required packages
+import json, os, threading, time
+from contextlib import contextmanager
+
+# lock for appending to trace files from several threads of one process
+_trace_lock = threading.Lock()
+
+# define a class for the metrics of a single run
+class RunMetrics:
+
+    # create an instance of this class for a run of a model (file) on an experiment
+    def __init__(self, model_name, experiment_name = None):
+        self.record = {'model': model_name,
+                       'model_file': None,
+                       'experiment': experiment_name,
+                       'start': time.time(),
+                       'phases': {},
+                       'cached': False,
+                       'lp_reused': False,
+                       'attempts': 0,
+                       'failure': None,
+                       'exit_code': None,
+                       'peak_rss_kb': None,
+                       'pid': os.getpid(),
+                       'worker_peak_rss_kb': None,
+                       'log_tail': None}
+
+    # define a context manager for timing a phase (repeated phases add up)
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record['phases'][name] = self.record['phases'].get(name, 0.0) + time.perf_counter() - start
+
+    # define a function for a copy of the metrics (e.g. one per week model after a shared series phase)
+    def copy(self):
+        metrics = RunMetrics(self.record['model'], self.record['experiment'])
+        metrics.record = {**self.record, 'phases': dict(self.record['phases'])}
+        return metrics
+
+    # define a function for appending the record as a single line to a JSONL trace file
+    def write(self, trace_file):
+        line = json.dumps(self.record, default = str) + '\n'
+        with _trace_lock:
+            with open(trace_file, 'a') as fh:
+                fh.write(line)
+
+# define a function for reading the peak resident memory (VmHWM, in kB) of a running process (None if /proc does not report it)
+def read_peak_rss(pid):
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+# define a function for reading the last lines of a (log) file, None if it does not exist
+def file_tail(path, n_lines = 20, max_bytes = 8192):
+    try:
+        with open(path, 'rb') as fh:
+            fh.seek(0, 2)
+            size = fh.tell()
+            fh.seek(max(0, size - max_bytes))
+            lines = fh.read().decode(errors = 'replace').splitlines()
+    except OSError:
+        return None
+    return '\n'.join(lines[-n_lines:])
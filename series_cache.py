@@ -0,0 +1,64 @@
+'''
+Memoized cache for the generated scenario time series
+
+A generated input series depends only on the variable, its sampled value and
+the time horizon, so all policies and week models of one scenario can reuse
+it. The cache keeps the series as compact float64 arrays with a bounded total
+size and evicts the least recently used ones. It is shared by all models and
+threads of a process (the thread pool evaluator therefore shares it between
+all runs).
+
+'''
+
+# import required packages
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# define a class for a bounded, thread-safe cache of generated series
+class SeriesCache:
+
+    # create an instance of this class (maximum size in bytes, 128 MB by default, enough for about 2400 ten-week series)
+    def __init__(self, max_bytes = 128 * 1024**2):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # count the hits and misses
+        self.hits = 0
+        self.misses = 0
+
+    # define a function for getting a series from the cache, or computing and storing it
+    def get_or_compute(self, key, function):
+
+        # return a cached series as a list (the experiment writer writes lists as time series columns)
+        with self._lock:
+            array = self._entries.get(key)
+            if array is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return array.tolist()
+            self.misses += 1
+
+        # compute the series outside the lock, so other threads are not blocked
+        values = function()
+        array = np.array(values, dtype = float)
+        array.flags.writeable = False
+
+        # store it and evict the least recently used series until the cache fits (always keep the newest)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = array
+                self._size += array.nbytes
+                while self._size > self.max_bytes and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last = False)
+                    self._size -= evicted.nbytes
+
+        return values
+
+    # define a function for emptying the cache
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
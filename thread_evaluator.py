@@ -0,0 +1,90 @@
+'''
+Thread pool evaluator for the Linny-R connector
+
+The run-time of an experiment is dominated by the external Linny-R solver, so
+the Python side mostly waits for a subprocess. This evaluator runs the
+experiments from a pool of threads in a single process instead of one Python
+process per slot, which saturates the cores at a fraction of the memory.
+Every thread works on its own copies of the models (the shared reference data
+is not copied), and results are handed to the callback from the main thread.
+
+'''
+
+# import required packages
+import copy, os, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from ema_workbench.em_framework.evaluators import BaseEvaluator
+from ema_workbench.em_framework.experiment_runner import ExperimentRunner
+from ema_workbench.em_framework.model import AbstractModel
+from ema_workbench.em_framework.points import experiment_generator
+from ema_workbench.em_framework.util import NamedObjectMap
+from ema_workbench.util import get_module_logger
+from result_store import remaining_experiments
+
+_logger = get_module_logger(__name__)
+
+# define an evaluator that runs experiments concurrently from a thread pool
+class ThreadPoolEvaluator(BaseEvaluator):
+
+    # create an instance of this class (n_threads is the number of concurrent solver runs, timeout in seconds per run)
+    def __init__(self, msis, n_threads = None, timeout = None):
+        super().__init__(msis)
+        self.n_threads = n_threads if n_threads is not None else os.cpu_count()
+        self.timeout = timeout
+
+    def initialize(self):
+        self._pool = ThreadPoolExecutor(max_workers = self.n_threads, thread_name_prefix = 'linnyr')
+        self._local = threading.local()
+        self._runners = []
+        self._lock = threading.Lock()
+
+    def finalize(self):
+        self._pool.shutdown(wait = True)
+        for runner in self._runners:
+            runner.cleanup()
+        self._runners = []
+
+    # define a function for getting the experiment runner (with private model copies) of the current thread
+    def _get_runner(self):
+        runner = getattr(self._local, 'runner', None)
+        if runner is None:
+
+            # copy the models, because the workbench keeps the policy and outputs of a run on the model object
+            models = copy.deepcopy(self._msis)
+            if self.timeout is not None:
+                for model in models:
+                    model.timeout = self.timeout
+
+            msis = NamedObjectMap(AbstractModel)
+            msis.extend(models)
+            runner = ExperimentRunner(msis)
+
+            self._local.runner = runner
+            with self._lock:
+                self._runners.append(runner)
+        return runner
+
+    # define the function that is executed by the threads
+    def _run(self, experiment):
+        return experiment, self._get_runner().run_experiment(experiment)
+
+    def evaluate_experiments(self, scenarios, policies, callback, combine = 'factorial', **kwargs):
+        _logger.info(f'performing experiments using a pool of {self.n_threads} threads')
+
+        # skip the experiments that are already in a streaming result store (when resuming)
+        ex_gen = experiment_generator(scenarios, self._msis, policies, combine = combine)
+        ex_gen = remaining_experiments(ex_gen, callback)
+
+        # keep a bounded number of experiments in flight and report finished ones from this thread
+        pending = set()
+        for experiment in ex_gen:
+            pending.add(self._pool.submit(self._run, experiment))
+            if len(pending) >= 2 * self.n_threads:
+                done, pending = wait(pending, return_when = FIRST_COMPLETED)
+                for future in done:
+                    callback(*future.result())
+
+        while pending:
+            done, pending = wait(pending, return_when = FIRST_COMPLETED)
+            for future in done:
+                callback(*future.result())
@@ -0,0 +1,161 @@
+'''
+Vectorized time series engine for the Linny-R connector
+
+Builds the quarterly input series of the Botlek models with NumPy instead of
+nested Python loops. Every function reproduces the floating point operations
+of the original loop-based code element by element, so the generated inputs
+are bit-identical.
+
+All series functions accept an optional array of quarter positions within the
+full horizon. If given, the series is only evaluated at those positions
+(sparse evaluation), which is all that is needed for the characteristic weeks.
+
+'''
+
+# import required packages
+import math
+import numpy as np
+
+# define the resolution of the time series
+QUARTERS_PER_HOUR = 4
+QUARTERS_PER_DAY = 24 * QUARTERS_PER_HOUR
+DAYS_PER_YEAR = 365
+
+# define a function for a quarterly reference series scaled linearly towards a factor over the time horizon
+def scaled_ramp(data, factor, time_horizon, positions = None):
+
+    # convert the reference data (one year of quarters) to an array
+    data = np.asarray(data, dtype = float)
+
+    # sparse evaluation: look up the reference value and year of every position
+    if positions is not None:
+        years = positions // len(data) + 1
+        data = data[positions % len(data)]
+        step = ((data * factor) - data) / time_horizon
+        return data + (step * years)
+
+    # calculate the yearly step towards the scaled value
+    step = ((data * factor) - data) / time_horizon
+
+    # broadcast the steps over the years and flatten to one long series
+    years = np.arange(1, time_horizon + 1)
+    return (data + (step * years[:, None])).ravel()
+
+# define a function for an hourly series interpolated between two reference years (e.g. 2019 and scaled 2030)
+def interpolated_ramp(start_data, end_data, factor, time_horizon, positions = None):
+
+    # convert the hourly reference data to arrays
+    start_data = np.asarray(start_data, dtype = float)
+    end_data = np.asarray(end_data, dtype = float)
+
+    # sparse evaluation: look up the hour and year of every position
+    if positions is not None:
+        hours = positions // QUARTERS_PER_HOUR
+        years = hours // len(start_data) + 1
+        start_data = start_data[hours % len(start_data)]
+        end_data = end_data[hours % len(end_data)]
+        step = ((end_data * factor) - start_data) / time_horizon
+        return start_data + (step * years)
+
+    # calculate the yearly step from the start data towards the scaled end data
+    step = ((end_data * factor) - start_data) / time_horizon
+
+    # broadcast the steps over the years and expand every hour to four quarters
+    years = np.arange(1, time_horizon + 1)
+    hour_est = start_data + (step * years[:, None])
+    return np.repeat(hour_est.ravel(), QUARTERS_PER_HOUR)
+
+# define a function for a daily linear function from a current value to a future value
+def linear_ramp(current_value, future_value, time_horizon, positions = None):
+
+    # calculate the daily gradient
+    days = time_horizon * DAYS_PER_YEAR
+    gradient = (future_value - current_value) / days
+
+    # sparse evaluation: evaluate the linear function for the day of every position
+    if positions is not None:
+        return gradient * (positions // QUARTERS_PER_DAY + 1) + current_value
+
+    # evaluate the linear function for every day and expand every day to 96 quarters
+    day_est = gradient * np.arange(1, days + 1) + current_value
+    return np.repeat(day_est, QUARTERS_PER_DAY)
+
+# define a function for a daily sinus curve with a cyclical frequency per year
+def sinusoid(cyclical_frequency, time_horizon, amplitude = 450, offset = 550, positions = None):
+
+    # convert the frequency per year to a frequency per day
+    cyclical_freq = cyclical_frequency / DAYS_PER_YEAR
+
+    # sparse evaluation: evaluate the sinus curve for the day of every position
+    if positions is not None:
+        t = positions // QUARTERS_PER_DAY
+        return amplitude * np.sin(cyclical_freq * 2 * math.pi * t) + offset
+
+    # evaluate the sinus curve for every day and expand every day to 96 quarters
+    t = np.arange(time_horizon * DAYS_PER_YEAR)
+    day_est = amplitude * np.sin(cyclical_freq * 2 * math.pi * t) + offset
+    return np.repeat(day_est, QUARTERS_PER_DAY)
+
+# define a function that puts the rounded mean in front of a series (Linny-R uses it as default value)
+def with_default(values):
+    rounded_mean = round(np.mean(values), 0)
+    return [rounded_mean] + list(values)
+
+# define a class for extracting the characteristic weeks from a full horizon series
+class CharacteristicWeeks:
+
+    # create an instance of this class from a list based extraction function
+    def __init__(self, function):
+
+        # the original extraction function (takes and returns a list)
+        self.function = function
+
+        # cache of index arrays per series length (None if the function is not a plain selection)
+        self._indices = {}
+
+    # define a function for determining the selected indices for a series length
+    def indices(self, length):
+
+        if length not in self._indices:
+
+            # probe the extraction function with the positions themselves
+            indices = np.asarray(self.function(list(range(length))))
+
+            # only accept the probe if the function selects integer positions within the series
+            if indices.ndim != 1 or not np.issubdtype(indices.dtype, np.integer) \
+                    or (indices.size and (indices.min() < 0 or indices.max() >= length)):
+                indices = None
+
+            # and if it gives exactly the same values for a random series
+            else:
+                probe = np.random.default_rng(0).random(length)
+                if not np.array_equal(np.asarray(self.function(probe.tolist())), probe[indices]):
+                    indices = None
+
+            self._indices[length] = indices
+
+        return self._indices[length]
+
+    # define a function for evaluating a series function at the characteristic weeks only (if possible)
+    def evaluate(self, function, length, *args, sparse = True):
+
+        # the selected positions within a series of this length (None if not a plain selection)
+        positions = self.indices(length) if sparse else None
+
+        # evaluate the series only at the selected positions, otherwise build the full series and extract
+        if positions is not None:
+            return function(*args, positions = positions).tolist()
+        else:
+            return self(function(*args))
+
+    # define a function for extracting the characteristic weeks from a series
+    def __call__(self, series):
+
+        series = np.asarray(series, dtype = float)
+        indices = self.indices(len(series))
+
+        # select by index array if possible, otherwise fall back to the original function
+        if indices is not None:
+            return series[indices].tolist()
+        else:
+            return list(self.function(series.tolist()))